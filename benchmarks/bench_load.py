@@ -0,0 +1,190 @@
+# ----------------------------------------------------------------------------
+# bench_load.py
+# Benchmarks for loading ScanM files, based on synthetic recordings
+#
+# The MIT License (MIT)
+# (c) Copyright 2022-23 Thomas Euler, Jonathan Oesterle
+#
+# 2026-10-17, first implementation
+#
+# Usage:
+#   python benchmarks/bench_load.py [--sizes small,medium] [--save [FILE]]
+#                                   [--compare [FILE]] [--tolerance 0.25] [--repeat 3]
+#
+# `--compare` (without FILE) checks the results against the reference baseline
+# `benchmarks/baseline.json` in the repository and exits with 1 if a benchmark
+# is slower or needs more memory (by more than `--tolerance`, relative). The
+# timings depend on the machine; hence, to track regressions, first run the
+# benchmarks on the unchanged code and save the results (`--save` without FILE
+# overwrites the reference baseline), then compare after the change; timings
+# below 1 ms vary between runs, use a larger `--repeat` for these. Update
+# and commit the reference baseline if a change affects the performance on
+# purpose.
+#
+# The peak memory (`peak MB`) is measured with `tracemalloc`, which does not
+# include memory-mapped pages, i.e. the `*_mmap` benchmarks show only the
+# memory allocated in addition to the mapped `.smp` file.
+# ----------------------------------------------------------------------------
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from scanmsupport.scanm.helpers import gen_scmf_files
+from scanmsupport.scanm.scanm_smh import SMH
+from scanmsupport.scanm.scanm_smp import SMP
+
+# Synthetic recordings (parameters of `gen_scmf_files`)
+BENCH_sizes = {
+    "small": dict(dxFr=80, dyFr=64, nFr=100, inputChMask=0b111),
+    "medium": dict(dxFr=80, dyFr=64, nFr=2000, inputChMask=0b111),
+    "large": dict(dxFr=128, dyFr=128, nFr=4000, inputChMask=0b111),
+    "double": dict(dxFr=80, dyFr=64, nFr=1000, inputChMask=0b011, pixSize_byte=8),
+    "xzy": dict(dxFr=80, dzFr=64, nFr=2000, inputChMask=0b111, scanMode=4),
+}
+
+# Recorded headers (in the repository); parsing a single header takes well below
+# 1 ms, hence, the time is measured for `BENCH_nHeaderLoads` loads and divided
+BENCH_headers = {
+    "xy_scan": os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "data", "xy_scan",
+        "M1_LR_GCL4_chirp.smh"
+    ),
+}
+BENCH_nHeaderLoads = 200
+
+# Reference baseline (see `--compare`)
+BENCH_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+# ----------------------------------------------------------------------------
+def _load_smh(fPath):
+    smh = SMH()
+    assert smh.loadSMH(fPath) == 0
+
+
+def _load_smh_many(fPath, n):
+    for _ in range(n):
+        _load_smh(fPath)
+
+
+def _load_smp(fPath, mode):
+    smp = SMP()
+    smp.loadSMH(fPath)
+    assert smp.loadSMP(mode=mode) == 0
+    return smp
+
+
+def _get_data_cropped(fPath, mode):
+    smp = _load_smp(fPath, mode)
+    for ch in smp.channels:
+        smp.getData(ch, crop=True).sum()
+
+
+def _measure(func, *args, repeat=3):
+    """ Return best wall time (s) and peak traced memory (bytes) of `func`
+    """
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - t0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def run(sizes, dataDir, repeat=3):
+    """ Generate recordings (if needed) and run all benchmarks; returns a dict
+        `{"<size>/<benchmark>": {"time_s": ..., "peak_MB": ..., "file_MB": ...}}`
+    """
+    results = dict()
+    print("peak MB: memory traced by `tracemalloc` (w/o memory-mapped pages)")
+    for size in sizes:
+        fPath = os.path.join(dataDir, f"bench_{size}.smh")
+        if not os.path.exists(fPath):
+            gen_scmf_files(fPath, **BENCH_sizes[size])
+        file_MB = os.path.getsize(fPath.replace(".smh", ".smp")) / 1E6
+
+        benchmarks = {
+            "loadSMH": (_load_smh, fPath),
+            "loadSMP_read": (_load_smp, fPath, "read"),
+            "loadSMP_mmap": (_load_smp, fPath, "mmap"),
+            "getData_crop_read": (_get_data_cropped, fPath, "read"),
+            "getData_crop_mmap": (_get_data_cropped, fPath, "mmap"),
+        }
+        for name, (func, *args) in benchmarks.items():
+            dt, peak = _measure(func, *args, repeat=repeat)
+            key = f"{size}/{name}"
+            results[key] = {"time_s": dt, "peak_MB": peak / 1E6, "file_MB": file_MB}
+            print(f"{key:32} {dt * 1E3:10.2f} ms {peak / 1E6:10.1f} MB peak "
+                  f"({file_MB:.1f} MB file)")
+
+    # Header parsing (`loadSMH`, per header) for recorded files
+    for name, fPath in BENCH_headers.items():
+        if not os.path.exists(fPath):
+            continue
+        dt, peak = _measure(_load_smh_many, fPath, BENCH_nHeaderLoads, repeat=repeat)
+        key = f"{name}/loadSMH"
+        dt /= BENCH_nHeaderLoads
+        results[key] = {"time_s": dt, "peak_MB": peak / 1E6, "file_MB": 0.}
+        print(f"{key:32} {dt * 1E6:10.1f} us (per header)")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Report benchmarks that are slower or need more memory than the baseline
+        (by more than `tolerance`, relative); returns the number of regressions
+    """
+    nReg = 0
+    for key, res in results.items():
+        if key not in baseline:
+            continue
+        for m in ["time_s", "peak_MB"]:
+            ref = baseline[key][m]
+            if ref > 0 and res[m] > ref * (1 + tolerance):
+                print(f"REGRESSION {key} {m}: {res[m]:.4g} vs. {ref:.4g} (baseline)")
+                nReg += 1
+    print(f"{nReg} regression(s) (tolerance {tolerance:.0%})")
+    return nReg
+
+
+# ----------------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for loading ScanM files")
+    parser.add_argument("--sizes", default="small,medium",
+                        help=f"comma-separated, from {', '.join(BENCH_sizes)}")
+    parser.add_argument("--data-dir", default=None,
+                        help="directory for the synthetic recordings (default: temporary)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", nargs="?", const=BENCH_baseline, default=None,
+                        help="save results as baseline (JSON, default: reference baseline)")
+    parser.add_argument("--compare", nargs="?", const=BENCH_baseline, default=None,
+                        help="compare with baseline (JSON, default: reference baseline)")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    sizes = args.sizes.split(",")
+    with tempfile.TemporaryDirectory() as tmpDir:
+        results = run(sizes, args.data_dir or tmpDir, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(results, json.load(f), args.tolerance) else 0)
+
+# ----------------------------------------------------------------------------
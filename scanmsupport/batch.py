@@ -0,0 +1,181 @@
+# ----------------------------------------------------------------------------
+# batch.py
+# Loading many ScanM recordings in parallel
+#
+# The MIT License (MIT)
+# (c) Copyright 2022-23 Thomas Euler, Jonathan Oesterle
+#
+# 2026-10-17, first implementation
+# ----------------------------------------------------------------------------
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .scanm.scanm_global import *
+from .scanm.scanm_smp import SMP
+
+
+# ----------------------------------------------------------------------------
+class LoadResult(object):
+    """ Result of loading one recording with `load_many`
+
+        `smp` is the `SMP` object (header and pixel data geometry), `data` a dict
+        that maps the loaded AI channels to their pixel data (with `mode="mmap"`,
+        only the channels that are views into the mapped file, the others are
+        gathered on demand by `smp.getData`). If loading failed, `errC` contains
+        the error code and `error` a message; `smp` and `data` are then None and
+        empty, respectively
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.smp = None
+        self.data = dict()
+        self.errC = ERR_Ok
+        self.error = ""
+        self.nBytes = 0
+        self.time_s = 0.
+
+    @property
+    def ok(self):
+        return self.errC == ERR_Ok and len(self.error) == 0
+
+    def __repr__(self):
+        s = "ok" if self.ok else f"error ({self.errC}): {self.error}"
+        return f"LoadResult(`{self.path}`, {s})"
+
+
+class BatchResults(list):
+    """ List of `LoadResult` (in input order) with throughput statistics in `stats`
+    """
+
+    def __init__(self, results, stats):
+        super().__init__(results)
+        self.stats = stats
+
+
+# ----------------------------------------------------------------------------
+def load_many(paths, workers=None, channels=None, crop=False,
+              mode=SCMIO_loadMode_read):
+    """ Load the recordings (`.smh`/`.smp` pairs) in `paths` using a pool of
+        `workers` processes (default: number of CPUs; 1 loads in-process)
+
+        With `mode="read"`, the workers parse the headers and decode the pixel
+        data (cropped to the imaging region, if `crop` is True) into shared
+        memory (temporary files in `/dev/shm`, if available, that are mapped
+        by the calling process), hence, no large pickles are passed between
+        processes. With `mode="mmap"`, the workers only parse the headers; the
+        pixel data is then memory-mapped (once) in the calling process and
+        returned as lazy handles, i.e. nothing is read or gathered until the
+        data is accessed (see `LoadResult`).
+        `channels` selects the AI channels (default: all recorded channels).
+
+        Errors are returned per file in the respective `LoadResult`, the batch
+        is not aborted. Returns a `BatchResults` list in the order of `paths`.
+    """
+    assert mode in SCMIO_loadModes, f"ABORT: Invalid load mode `{mode}`"
+    paths = list(paths)
+    args = [(p, channels, crop, mode) for p in paths]
+
+    t0 = time.perf_counter()
+    if workers == 1:
+        results = [_load_one(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_load_one, *zip(*args))) if args else []
+    for res in results:
+        _attach_data(res, channels, crop, mode)
+    dt = time.perf_counter() - t0
+
+    # Report throughput
+    nBytes = sum(res.nBytes for res in results)
+    nFailed = sum(not res.ok for res in results)
+    stats = {
+        "nFiles": len(results),
+        "nFailed": nFailed,
+        "nBytes": nBytes,
+        "time_s": dt,
+        "files_per_s": len(results) / dt if dt > 0 else 0.,
+        "MB_per_s": nBytes / 1E6 / dt if dt > 0 else 0.
+    }
+    scm_log(
+        f"{len(results)} file(s) ({nFailed} failed), {nBytes / 1E6:.1f} MB "
+        f"in {dt:.2f} s ({stats['files_per_s']:.1f} files/s, "
+        f"{stats['MB_per_s']:.1f} MB/s)"
+    )
+    return BatchResults(results, stats)
+
+
+def _load_one(path, channels, crop, mode):
+    """ Load one recording (runs in worker process)
+    """
+    res = LoadResult(path)
+    t0 = time.perf_counter()
+    try:
+        smp = SMP()
+        res.errC = smp.loadSMH(path)
+        if res.errC == ERR_Ok and mode == SCMIO_loadMode_read:
+            res.errC = smp.loadSMP(mode=mode, channels=channels)
+        if res.errC != ERR_Ok:
+            res.error = _err_str(res.errC, path)
+            return res
+
+        fPathSMP = smp.filePath + "." + SCMIO_pixelDataFileExtStr
+        res.nBytes = os.path.getsize(fPathSMP) if os.path.exists(fPathSMP) else 0
+        if mode == SCMIO_loadMode_read:
+            # Move pixel data into shared memory
+            shmDir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+            for ch in smp.channels:
+                fd, fPath = tempfile.mkstemp(suffix=".npy", prefix="scm_", dir=shmDir)
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, smp.getData(ch, crop=crop))
+                res.data[ch] = fPath
+            smp._unloadPixData()
+        res.smp = smp
+
+    except Exception as e:
+        res.error = f"{type(e).__name__}: {e}"
+        for fPath in res.data.values():
+            os.remove(fPath)
+        res.data = dict()
+    finally:
+        res.time_s = time.perf_counter() - t0
+    return res
+
+
+def _attach_data(res, channels, crop, mode):
+    """ Attach pixel data to a `LoadResult` returned by a worker process
+    """
+    if mode == SCMIO_loadMode_read:
+        # Map shared memory (copy-on-write); the mapping stays valid after the
+        # file has been removed
+        for ch, fPath in list(res.data.items()):
+            res.data[ch] = np.load(fPath, mmap_mode="c")
+            os.remove(fPath)
+        return
+
+    if not res.ok:
+        return
+    try:
+        res.errC = res.smp.loadSMP(mode=mode, channels=channels)
+        if res.errC != ERR_Ok:
+            res.error = _err_str(res.errC, res.path)
+            res.smp = None
+            return
+        # Only channels that need not be gathered from the pixel buffers
+        for j, ch in enumerate(res.smp.channels):
+            if res.smp._isFrDataView(j):
+                res.data[ch] = res.smp.getData(ch, crop=crop)
+    except Exception as e:
+        res.error = f"{type(e).__name__}: {e}"
+        res.smp = None
+        res.data = dict()
+
+
+def _err_str(errC, path):
+    return ERRStr[errC].format(path) if errC < len(ERRStr) else "Unknown error"
+
+# ----------------------------------------------------------------------------
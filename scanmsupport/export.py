@@ -0,0 +1,234 @@
+# ----------------------------------------------------------------------------
+# export.py
+# Export of ScanM recordings to chunked HDF5 or Zarr files
+#
+# The MIT License (MIT)
+# (c) Copyright 2022-23 Thomas Euler, Jonathan Oesterle
+#
+# 2026-10-17, first implementation
+# ----------------------------------------------------------------------------
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .scanm.scanm_global import *
+
+SCMIO_exportCompressions = [None, "gzip", "blosc"]
+
+
+# ----------------------------------------------------------------------------
+def export_data(smp, fPath, channels=None, crop=True, chunk_frames=64,
+                compression="gzip", level=4, shuffle=True, workers=None):
+    """ Export the pixel data of recording `smp` (an `SMP` object with loaded
+        header) to the HDF5 file `fPath` or, if `fPath` ends with `.zarr`, to
+        a Zarr store
+
+        Every AI channel in `channels` (default: all recorded channels) becomes
+        one `(x, y, t)` (or, for volumes, `(x, y, z, t)`) dataset `wDataChX` (i.e.
+        `getData(ch, crop).T`, the layout of the `SMP_*.h5` files), chunked into
+        blocks of `chunk_frames` complete frames. The data is streamed from the `.smp` file one chunk at
+        a time; chunks are compressed (`compression` in `SCMIO_exportCompressions`
+        at `level`, with byte `shuffle`) by a pool of `workers` threads, hence,
+        memory use is limited to a few chunks per worker. `"blosc"` requires
+        Zarr. Scalar header parameters are stored as attributes of the file.
+
+        Returns a dict with the number of raw and written bytes and the time;
+        raises `ValueError` if the frames of a channel cannot be read
+    """
+    assert compression in SCMIO_exportCompressions, \
+        f"ABORT: Invalid compression `{compression}`"
+    recChList = [i for i in range(SCMIO_maxInputChans) if smp.inputChMask & (2 ** i)]
+    chList = recChList if channels is None else sorted(set(channels))
+    for ch in chList:
+        if not smp._prepareFrameAccess(ch):
+            raise ValueError(f"Cannot export AI channel {ch}")
+
+    g = smp._pixGeomDict
+    nFr = g["nFr"]
+    shape = smp._getDecFrShape(crop)[::-1] + (nFr,)
+    chunk_frames = max(1, min(int(chunk_frames), nFr))
+    chunks = shape[:-1] + (chunk_frames,)
+    decoder = smp._StimBuf.decoder
+    dtype = g["dtype"] if decoder is None else decoder.dtype
+
+    if fPath.rstrip("/").endswith(".zarr"):
+        out = _ZarrOut(fPath, chList, shape, chunks, dtype, compression, level, shuffle)
+    else:
+        assert compression != "blosc", "ABORT: `blosc` compression requires Zarr"
+        out = _H5Out(fPath, chList, shape, chunks, dtype, compression, level, shuffle)
+
+    t0 = time.perf_counter()
+    nBytes = 0
+    workers = workers or os.cpu_count()
+    try:
+        out.setAttrs(_header_attrs(smp))
+        with open(smp.filePath + "." + SCMIO_pixelDataFileExtStr, "rb") as f, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for iFr in range(0, nFr, chunk_frames):
+                n = min(chunk_frames, nFr - iFr)
+                blocks = smp._readFrameBlock(f, chList, iFr, n, crop)
+                for ch, block in zip(chList, blocks):
+                    pending.append((ch, iFr, pool.submit(out.encode, ch, iFr, block)))
+                    nBytes += block.nbytes
+                # Limit the number of chunks in flight
+                while len(pending) > 2 * workers:
+                    out.write(*_result(pending.popleft()))
+            while pending:
+                out.write(*_result(pending.popleft()))
+    finally:
+        out.close()
+
+    dt = time.perf_counter() - t0
+    res = {
+        "nBytes": nBytes, "nBytesWritten": out.nBytesWritten, "time_s": dt,
+        "MB_per_s": nBytes / 1E6 / dt if dt > 0 else 0.
+    }
+    scm_log(
+        f"{len(chList)} channel(s), {nBytes / 1E6:.1f} MB exported to `{fPath}` "
+        f"in {dt:.2f} s ({res['MB_per_s']:.1f} MB/s)"
+    )
+    return res
+
+
+def _result(item):
+    ch, iFr, fut = item
+    return ch, iFr, fut.result()
+
+
+def _header_attrs(smp):
+    """ Return the scalar header parameters as dict of built-in types
+    """
+    attrs = {"GUID": smp._SMHPreHdrDict.get("GUID", "")}
+    for key, (_, _, val) in smp._kvPairDict.items():
+        if isinstance(val, list):
+            attrs[key] = SCMIO_subEntrySep.join(val)
+        elif isinstance(val, (str, int, float, np.integer, np.floating)):
+            attrs[key] = val.item() if isinstance(val, np.generic) else val
+    return attrs
+
+
+def _encode_chunk(block, chunks, compression, level, shuffle):
+    """ Encode a `(n, y, x)` block of frames as one `chunks`-sized HDF5 chunk
+        (the shuffle and deflate filters, in this order)
+    """
+    data = np.zeros(chunks, dtype=block.dtype)
+    data[..., :len(block)] = block.T
+    buf = data.tobytes()
+    if shuffle and data.itemsize > 1:
+        buf = np.frombuffer(buf, np.uint8).reshape((-1, data.itemsize)).T.tobytes()
+    if compression == "gzip":
+        buf = zlib.compress(buf, level)
+    return buf
+
+
+# ----------------------------------------------------------------------------
+class _H5Out(object):
+    """ HDF5 output; compressed chunks are written directly, bypassing the
+        (single-threaded) HDF5 filter pipeline
+    """
+
+    def __init__(self, fPath, chList, shape, chunks, dtype, compression, level, shuffle):
+        import h5py
+
+        self._f = h5py.File(fPath, "w")
+        self._chunks = chunks
+        self._compression = compression
+        self._level = level
+        self._shuffle = shuffle and compression is not None
+        self._dsets = dict()
+        for ch in chList:
+            self._dsets[ch] = self._f.create_dataset(
+                SCMIO_pixDataWaveDecodeFormat.format(ch), shape=shape, chunks=chunks,
+                dtype=dtype, shuffle=self._shuffle, compression=compression,
+                compression_opts=level if compression else None
+            )
+        self.nBytesWritten = 0
+
+    def setAttrs(self, attrs):
+        for key, val in attrs.items():
+            self._f.attrs[key] = val
+
+    def encode(self, ch, iFr, block):
+        if self._compression is None:
+            return np.ascontiguousarray(block.T)
+        return _encode_chunk(block, self._chunks, self._compression, self._level, self._shuffle)
+
+    def write(self, ch, iFr, data):
+        if self._compression is None:
+            self._dsets[ch][..., iFr:iFr + data.shape[-1]] = data
+            self.nBytesWritten += data.nbytes
+        else:
+            offs = (0,) * (len(self._chunks) - 1) + (iFr,)
+            self._dsets[ch].id.write_direct_chunk(offs, data)
+            self.nBytesWritten += len(data)
+
+    def close(self):
+        self._f.close()
+
+
+class _ZarrOut(object):
+    """ Zarr output; chunks are independent, hence, the worker threads write
+        (and compress) them directly
+    """
+
+    def __init__(self, fPath, chList, shape, chunks, dtype, compression, level, shuffle):
+        import zarr
+
+        self._g = zarr.open_group(fPath, mode="w")
+        self._arrs = dict()
+        if int(zarr.__version__.split(".")[0]) >= 3:
+            from zarr import codecs
+
+            if compression == "gzip":
+                compressors = codecs.GzipCodec(level=level)
+            elif compression == "blosc":
+                compressors = codecs.BloscCodec(
+                    cname="zstd", clevel=level, shuffle="shuffle" if shuffle else "noshuffle"
+                )
+            else:
+                compressors = None
+            for ch in chList:
+                self._arrs[ch] = self._g.create_array(
+                    SCMIO_pixDataWaveDecodeFormat.format(ch), shape=shape, chunks=chunks,
+                    dtype=dtype, compressors=compressors
+                )
+        else:
+            import numcodecs
+
+            if compression == "gzip":
+                compressor = numcodecs.Zlib(level=level)
+            elif compression == "blosc":
+                compressor = numcodecs.Blosc(
+                    cname="zstd", clevel=level,
+                    shuffle=numcodecs.Blosc.SHUFFLE if shuffle else numcodecs.Blosc.NOSHUFFLE
+                )
+            else:
+                compressor = None
+            for ch in chList:
+                self._arrs[ch] = self._g.create_dataset(
+                    SCMIO_pixDataWaveDecodeFormat.format(ch), shape=shape, chunks=chunks,
+                    dtype=dtype, compressor=compressor
+                )
+        self.nBytesWritten = 0
+
+    def setAttrs(self, attrs):
+        self._g.attrs.update(attrs)
+
+    def encode(self, ch, iFr, block):
+        self._arrs[ch][..., iFr:iFr + len(block)] = block.T
+        return None
+
+    def write(self, ch, iFr, data):
+        pass
+
+    def close(self):
+        for a in self._arrs.values():
+            n = a.nbytes_stored
+            self.nBytesWritten += n() if callable(n) else n
+
+# ----------------------------------------------------------------------------
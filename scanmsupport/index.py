@@ -0,0 +1,214 @@
+# ----------------------------------------------------------------------------
+# index.py
+# Header-only metadata index for ScanM recordings
+#
+# The MIT License (MIT)
+# (c) Copyright 2022-23 Thomas Euler, Jonathan Oesterle
+#
+# 2026-10-17, first implementation
+# ----------------------------------------------------------------------------
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .scanm.scanm_global import *
+from .scanm.scanm_smh import SMH
+
+SMHIndex_preHdrKeys = [
+    "GUID", "headerLen_byte", "headerLen_values", "headerStart_bytes",
+    "pixDataLen_byte", "analogDataLen_byte"
+]
+SMHIndex_operators = ["=", "!=", "<", "<=", ">", ">=", "like"]
+
+
+# ----------------------------------------------------------------------------
+class SMHIndex(object):
+    """ SQLite index of the `.smh` headers below one or more directories
+
+        Only the headers are parsed (in parallel); for every file, the pre-header
+        fields and all key-value pairs are stored. Updating is incremental, based
+        on file size and modification time. Queries never touch `.smp` files, e.g.:
+
+            idx = SMHIndex("headers.sqlite")
+            idx.update("/gpfs01/euler/data/Data")
+            paths = idx.find(
+                ScanMode=ScM_scanMode_XYImage, Zoom=(">=", 2),
+                NumberOfInputChans=3, DateStamp=("like", "2018-%")
+            )
+    """
+
+    def __init__(self, dbPath):
+        self._dbPath = dbPath
+        self._db = sqlite3.connect(dbPath)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, size INTEGER, mtime REAL, errC INTEGER,
+                GUID TEXT, headerLen_byte INTEGER, headerLen_values INTEGER,
+                headerStart_bytes INTEGER, pixDataLen_byte INTEGER,
+                analogDataLen_byte INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS params (
+                path TEXT, key TEXT, num REAL, str TEXT, isJSON INTEGER,
+                PRIMARY KEY (path, key)
+            );
+            CREATE INDEX IF NOT EXISTS params_key_num ON params (key, num);
+            CREATE INDEX IF NOT EXISTS params_key_str ON params (key, str);
+        """)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def update(self, rootDir, workers=None):
+        """ Index all `.smh` files below `rootDir`; only new or changed files
+            (size or modification time) are parsed, entries of files that no
+            longer exist are removed. Returns a dict with the respective counts
+        """
+        # Collect header files and compare with index
+        rootDir = os.path.abspath(rootDir)
+        found = dict()
+        for dirPath, _, fNames in os.walk(rootDir):
+            for fName in fNames:
+                if os.path.splitext(fName)[1] == "." + SCMIO_headerFileExtStr:
+                    fPath = os.path.join(dirPath, fName)
+                    st = os.stat(fPath)
+                    found[fPath] = (st.st_size, st.st_mtime)
+
+        # Compare the path prefix literally (`LIKE` would treat `_` and `%` in
+        # directory names as wildcards and ignore case)
+        known = dict()
+        prefix = os.path.join(rootDir, "")
+        rows = self._db.execute(
+            "SELECT path, size, mtime FROM files WHERE substr(path, 1, ?) = ?",
+            (len(prefix), prefix)
+        )
+        for fPath, size, mtime in rows:
+            known[fPath] = (size, mtime)
+
+        toParse = [p for p, v in found.items() if known.get(p) != v]
+        toRemove = [p for p in known if p not in found]
+
+        # Parse new and changed headers in parallel
+        if workers == 1:
+            parsed = [_parse_header(p) for p in toParse]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = list(pool.map(_parse_header, toParse, chunksize=16))
+
+        with self._db:
+            for fPath in toRemove + toParse:
+                self._db.execute("DELETE FROM files WHERE path = ?", (fPath,))
+                self._db.execute("DELETE FROM params WHERE path = ?", (fPath,))
+            for fPath, errC, preHdr, params in parsed:
+                size, mtime = found[fPath]
+                self._db.execute(
+                    "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (fPath, size, mtime, errC) +
+                    tuple(preHdr.get(k) for k in SMHIndex_preHdrKeys)
+                )
+                self._db.executemany(
+                    "INSERT INTO params VALUES (?, ?, ?, ?, ?)",
+                    [(fPath,) + p for p in params]
+                )
+
+        res = {
+            "nFiles": len(found),
+            "nParsed": len(toParse),
+            "nRemoved": len(toRemove),
+            "nFailed": sum(p[1] != ERR_Ok for p in parsed)
+        }
+        scm_log(
+            f"{res['nFiles']} header(s) in `{rootDir}`, {res['nParsed']} parsed "
+            f"({res['nFailed']} failed), {res['nRemoved']} removed"
+        )
+        return res
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def find(self, **conditions):
+        """ Return the paths of all indexed headers that fulfill the conditions,
+            given as `key=value` or `key=(operator, value)` with the operator in
+            `SMHIndex_operators`. Keys are `.smh` parameter names (as in
+            `SCMIO_keys`) or pre-header fields (e.g. `GUID`)
+        """
+        sql = "SELECT path FROM files WHERE errC = 0"
+        args = []
+        for key, cond in conditions.items():
+            op, val = cond if isinstance(cond, tuple) else ("=", cond)
+            assert op in SMHIndex_operators, f"ABORT: Invalid operator `{op}`"
+            if key in SMHIndex_preHdrKeys:
+                sql += f" AND {key} {op} ?"
+            else:
+                col = "str" if isinstance(val, str) else "num"
+                sql += (
+                    " AND path IN (SELECT path FROM params"
+                    f" WHERE key = ? AND {col} {op} ?)"
+                )
+                args.append(key)
+            args.append(val)
+        return [r[0] for r in self._db.execute(sql + " ORDER BY path", args)]
+
+    def get(self, fPath):
+        """ Return the indexed parameters (incl. pre-header fields) for `fPath`
+            as dict, or None, if the file is not in the index
+        """
+        fPath = os.path.abspath(fPath)
+        row = self._db.execute(
+            "SELECT " + ", ".join(SMHIndex_preHdrKeys) + " FROM files WHERE path = ?",
+            (fPath,)
+        ).fetchone()
+        if row is None:
+            return None
+        d = dict(zip(SMHIndex_preHdrKeys, row))
+        rows = self._db.execute(
+            "SELECT key, num, str, isJSON FROM params WHERE path = ?", (fPath,)
+        )
+        for key, num, s, isJSON in rows:
+            d[key] = json.loads(s) if isJSON else (num if s is None else s)
+        return d
+
+    def query(self, sql, args=()):
+        """ Run an arbitrary SQL query on the index (tables `files` and `params`)
+        """
+        return self._db.execute(sql, args).fetchall()
+
+    @property
+    def nFiles(self):
+        return self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+
+# ----------------------------------------------------------------------------
+def _parse_header(fPath):
+    """ Parse header `fPath` and return `(fPath, errC, preHdrDict, params)`, with
+        `params` a list of `(key, num, str, isJSON)` tuples (runs in worker process)
+    """
+    smh = SMH()
+    try:
+        errC = smh.loadSMH(fPath)
+    except Exception:
+        errC = ERR_InvalidSMHObject
+    if errC != ERR_Ok:
+        return fPath, errC, dict(), []
+
+    params = []
+    for key, (_, _, val) in smh._kvPairDict.items():
+        if isinstance(val, (bool, int, float, np.integer, np.floating)):
+            params.append((key, float(val), None, 0))
+        elif isinstance(val, str):
+            params.append((key, None, val, 0))
+        elif val is None:
+            params.append((key, None, None, 0))
+        else:
+            # Lists and arrays are stored as JSON
+            params.append((key, None, json.dumps(np.asarray(val).tolist()), 1))
+    return fPath, errC, smh._SMHPreHdrDict, params
+
+# ----------------------------------------------------------------------------
@@ -5,7 +5,10 @@
 # (c) Copyright 23 Thomas Euler, Jonathan Oesterle
 #
 # 2023-08-29, first implementation
+# 2026-10-17, synthetic recordings
 # ----------------------------------------------------------------------------
+import os.path
+
 
 def gen_scmf_dict():
     """Generate a dictionary of the ScanM file format."""
@@ -80,4 +83,142 @@ def gen_scmf_dict():
             # 'PixBufCounter': [numpy.uint32, 1, 388]
             }
 
+
+def gen_scmf_files(fPath, dxFr=80, dyFr=64, dzFr=0, nFr=100, inputChMask=0b111,
+                   pixSize_byte=2, scanMode=0, nBufPerFr=2, dxRetrace=10,
+                   dxOffs=6, pixDur_us=5.0, nImgPerFr=1, nFrPerStep=1, data=None,
+                   seed=0, chunk_frames=256, scanPathFunc="XYScan2"):
+    """Generate a synthetic ScanM recording (`.smh` and `.smp` file)
+
+    The header is based on `gen_scmf_dict`; the pixel data is written in blocks
+    of `chunk_frames` frames as interleaved pixel buffers (`nBufPerFr` buffers
+    per frame), followed by the post-header with the GUID of the header.
+    Supported scan modes are `ScM_scanMode_XYImage` (frames of `dyFr` x `dxFr`
+    pixels), `ScM_scanMode_XZYImage` (frames of `dzFr` x `dxFr` pixels) and the
+    volumetric modes `ScM_scanMode_XYZImage` (`dzFr` x `dyFr` x `dxFr`) and
+    `ScM_scanMode_ZXYImage` (`dyFr` x `dxFr` x `dzFr`, z is the fast axis).
+    `dxRetrace` and `dxOffs` refer to the fast scan axis. With `nImgPerFr` > 1,
+    each frame contains as many images along the slow axis (bidirectional scan,
+    every other image is scanned backwards). With `nFrPerStep` > 1, a z-stack with
+    `nFr` steps of `nFrPerStep` frames each is generated. `data` optionally maps
+    AI channels to `(nFr * nFrPerStep, ..., dFast)` arrays with the pixel values in the order
+    they are scanned, otherwise random values are generated (using `seed`).
+    `scanPathFunc` is the name of the scan path function written to the header.
+    Returns the path of the `.smh` file.
+    """
+    import uuid
+    import numpy
+    from .scanm_global import (
+        SCMIO_maxInputChans, SCMIO_maxStimChans,
+        SCMIO_uint32Str, SCMIO_uint64Str, SCMIO_stringStr, SCMIO_real32Str,
+        SCMIO_headerFileExtStr, SCMIO_pixelDataFileExtStr,
+        ScM_scanMode_XYImage, ScM_scanMode_XZYImage, ScM_scanMode_XYZImage,
+        ScM_scanMode_ZXYImage, ScM_imageScanModes, ScM_scanType_timelapsed,
+        ScM_scanType_zStack,
+        scm_pack_pre_header, scm_encode_header
+    )
+    assert scanMode in ScM_imageScanModes, "ABORT: Scan mode not supported"
+    assert pixSize_byte in [2, 8], "ABORT: Invalid pixel size"
+    if scanMode == ScM_scanMode_XZYImage:
+        dyFr = 1
+    if scanMode == ScM_scanMode_ZXYImage:
+        dFast, dSlow = dzFr, dxFr * dyFr
+    else:
+        dFast = dxFr
+        dSlow = dyFr if scanMode == ScM_scanMode_XYImage else dzFr
+        dSlow *= dyFr if scanMode == ScM_scanMode_XYZImage else 1
+    nPixPerFr = dFast * dSlow
+    assert nPixPerFr % nBufPerFr == 0, "ABORT: Frame does not fit into pixel buffers"
+    pixBLen = nPixPerFr // nBufPerFr
+    chList = [i for i in range(SCMIO_maxInputChans) if inputChMask & (1 << i)]
+    stimChMask = 0b111
+    stimChList = [i for i in range(SCMIO_maxStimChans) if stimChMask & (1 << i)]
+    dtype = numpy.uint16 if pixSize_byte == 2 else numpy.float64
+
+    # Header parameters
+    d = gen_scmf_dict()
+    d.pop('NumberOfInputChans')
+    d['DateStamp'][2] = '2023-01-01'
+    d['PixelSizeInBytes'][2] = pixSize_byte
+    d['StimulusChannelMask'][2] = stimChMask
+    d['InputChannelMask'][2] = inputChMask
+    d['TargetedPixelDuration_µs'][2] = pixDur_us
+    d['RealPixelDuration_µs'][2] = pixDur_us
+    d['NumberOfFrames'][2] = nFr
+    d['FrameCounter'][2] = nFr
+    d['ScanMode'][2] = scanMode
+    d['ScanType'][2] = ScM_scanType_timelapsed if nFrPerStep == 1 else ScM_scanType_zStack
+    d['FrameWidth'][2] = dxFr
+    d['FrameHeight'][2] = dyFr
+    d['PixRetraceLen'][2] = dxRetrace
+    d['XPixLineOffs'][2] = dxOffs
+    d['ChunksPerFrame'][2] = nBufPerFr
+    d['nImgPerFr'][2] = nImgPerFr
+    d['dxFrDecoded'][2] = dxFr
+    d['dyFrDecoded'][2] = dyFr
+    d['dzFrDecoded'][2] = dzFr
+    d.update({
+        'ScanPathFunc': [numpy.character, 8, [
+            scanPathFunc, nPixPerFr, dFast, dSlow, dxRetrace, dxOffs, 0, 1
+        ]],
+        'MaxStimulusBufferMapLength': [numpy.uint32, 1, 1],
+        'NumberOfStimulusBuffers': [numpy.uint32, 1, len(stimChList)],
+        'NFrPerStep': [numpy.uint32, 1, nFrPerStep],
+        'dZPixels': [numpy.uint32, 1, dzFr],
+        'StimBufPerFr': [numpy.uint32, 1, 1]
+    })
+    if scanMode == ScM_scanMode_ZXYImage:
+        d.update({
+            'ZPixRetraceLen': [numpy.uint32, 1, dxRetrace],
+            'ZPixLineOffs': [numpy.uint32, 1, dxOffs],
+            'UsesZForFastScan': [numpy.uint32, 1, 1]
+        })
+    for iCh in stimChList:
+        d[f'Channel_{iCh}_StimulusBufferMapEntry_#0'] = [numpy.uint32, 1, iCh]
+    for i in range(len(stimChList)):
+        d[f'StimulusBufferLength_#{i}'] = [numpy.uint32, 1, nPixPerFr]
+        d[f'Channel_{i}_TargetedStimulusDuration_µs'] = [
+            numpy.float64, 1, nPixPerFr * pixDur_us]
+        d[f'AO_A_Channel_{i}_RealStimulusDuration_µs'] = [
+            numpy.float64, 1, nPixPerFr * pixDur_us]
+    for i in range(len(chList)):
+        d[f'PixelBuffer_#{i}_Length'] = [numpy.uint32, 1, pixBLen]
+
+    typeStr = {
+        numpy.character: SCMIO_stringStr, numpy.uint32: SCMIO_uint32Str,
+        numpy.uint64: SCMIO_uint64Str, numpy.float64: SCMIO_real32Str
+    }
+    kvPairs = []
+    for sKey, (tid, _, v) in d.items():
+        sVal = "|".join(str(x) for x in v) if isinstance(v, list) else str(v)
+        kvPairs.append((typeStr[tid], sKey, sVal))
+
+    # Encode header
+    nPixB = nFr * nFrPerStep * nBufPerFr
+    nByteData = nPixB * len(chList) * pixBLen * pixSize_byte
+    GUID = uuid.UUID(int=numpy.random.default_rng(seed).integers(2 ** 63)).hex
+    buf, preHdrDict = scm_encode_header(kvPairs, GUID, nByteData)
+
+    fPath = os.path.splitext(fPath)[0]
+    with open(fPath + "." + SCMIO_headerFileExtStr, "wb") as f:
+        f.write(buf)
+
+    # Write pixel data block by block
+    rng = numpy.random.default_rng(seed)
+    with open(fPath + "." + SCMIO_pixelDataFileExtStr, "wb") as f:
+        for t0 in range(0, nFr * nFrPerStep, chunk_frames):
+            n = min(chunk_frames, nFr * nFrPerStep - t0)
+            block = numpy.empty((n * nBufPerFr, len(chList), pixBLen), dtype)
+            for iCh, ch in enumerate(chList):
+                if data is not None and ch in data:
+                    fr = numpy.asarray(data[ch][t0:t0 + n], dtype)
+                elif pixSize_byte == 2:
+                    fr = rng.integers(0, 2 ** 16, size=(n, nPixPerFr), dtype=dtype)
+                else:
+                    fr = rng.standard_normal((n, nPixPerFr))
+                block[:, iCh, :] = fr.reshape((n * nBufPerFr, pixBLen))
+            f.write(block.tobytes())
+        f.write(scm_pack_pre_header("SMP", **preHdrDict))
+    return fPath + "." + SCMIO_headerFileExtStr
+
 # ----------------------------------------------------------------------------
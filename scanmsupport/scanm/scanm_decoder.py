@@ -0,0 +1,91 @@
+# ----------------------------------------------------------------------------
+# scanm_decoder.py
+# Decoders for pixel data recorded with external scan path functions
+#
+# The MIT License (MIT)
+# (c) Copyright 2022-23 Thomas Euler, Jonathan Oesterle
+#
+# 2026-10-17, first implementation
+# ----------------------------------------------------------------------------
+from .scanm_global import *
+
+# Registered decoder classes, by name of the scan path function
+SCMIO_decoderDict = dict()
+
+
+# ----------------------------------------------------------------------------
+class ScanDecoder(object):
+    """ Base class for decoders of external scan path functions
+
+        In the Igor code, the decoder (`<ScanPathFunc>_decode`) is called once per
+        pixel buffer. Here, `prepare` is called once per recording and `decode`
+        for blocks of complete frames, which it should process with NumPy:
+
+            @scm_register_decoder("MyScan")
+            class MyScanDecoder(ScanDecoder):
+                def prepare(self, stimBuf, params):
+                    self.frShape = (params[2], params[1])
+                    ...
+                    return ScM_PixDataDecoded
+
+                def decode(self, block):
+                    ...
+
+        `prepare` receives the `StimBuf` object (with the header as `stimBuf.smh`)
+        and the parameters of the scan path function (`ScanPathFunc` without the
+        name), sets `frShape` (shape of a decoded frame) and, optionally, `dtype`
+        (of the decoded data; default: that of the pixel data for resorting and
+        float64 for reconstructing decoders) and returns the decode mode, i.e.
+        `ScM_PixDataResorted` (pixels are only resorted) or `ScM_PixDataDecoded`
+        (frames are reconstructed, e.g. from a count matrix)
+
+        Resorting decoders are replaced by a single gather (`np.take`) with the
+        pixel permutation `pixIdx`, which `prepare` may set (an integer array of
+        shape `frShape` with indices into the pixels of a recorded frame); if not,
+        it is determined by decoding a frame of `np.int64` pixel indices, hence,
+        `decode` should keep the type of the data. Such recordings can also be
+        memory-mapped
+    """
+
+    def __init__(self):
+        self.frShape = None
+        self.dtype = None
+        self.pixIdx = None
+
+    def prepare(self, stimBuf, params):
+        raise NotImplementedError
+
+    def decode(self, block):
+        """ Decode an `(n, nPixPerFr)` block of `n` recorded frames of one AI
+            channel and return an `(n,) + frShape` array
+        """
+        raise NotImplementedError
+
+
+# ----------------------------------------------------------------------------
+def scm_register_decoder(name, decoderClass=None):
+    """ Register a `ScanDecoder` subclass for the scan path function `name`;
+        can also be used as class decorator
+    """
+    if decoderClass is None:
+        def _register(cls):
+            scm_register_decoder(name, cls)
+            return cls
+        return _register
+
+    assert issubclass(decoderClass, ScanDecoder), "ABORT: Decoder must be a `ScanDecoder`"
+    SCMIO_decoderDict[name] = decoderClass
+    return decoderClass
+
+
+def scm_unregister_decoder(name):
+    SCMIO_decoderDict.pop(name, None)
+
+
+def scm_get_decoder(name):
+    """ Return the decoder class registered for the scan path function `name`
+        or None
+    """
+    return SCMIO_decoderDict.get(name)
+
+# ----------------------------------------------------------------------------
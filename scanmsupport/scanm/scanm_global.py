@@ -7,14 +7,27 @@
 #
 # 2022-01-30, first implementation
 # 2023-06-16, changes to cope with older files
+# 2026-10-17, logging and per-stage statistics
 # ----------------------------------------------------------------------------
+import logging
+import re
 import struct
 import warnings
 from enum import Enum
 
 # pylint: disable=bad-whitespace
+# If set, messages are (also) printed, as in earlier versions
 SCMIO_VERBOSE = 0
 
+# Logger for all messages (quiet by default, except for warnings and errors, unless
+# configured, e.g. with `logging.basicConfig(level=logging.INFO)`); the per-stage
+# statistics of `SMH`/`SMP` are logged with level DEBUG
+SCMIO_logger = logging.getLogger("scanmsupport")
+
+# Optional function `hook(fPath, stage, statDict)`, called for every completed stage
+# of loading a file (see `SMH.stats`, `scm_set_stats_hook`)
+SCMIO_statsHook = None
+
 SCMIO_pixelDataFileExtStr = "smp"
 SCMIO_headerFileExtStr = "smh"
 SCMIO_configSetFileExtStr = "scmcfs"
@@ -29,10 +42,12 @@ SCMIO_uint32Str = "UINT32"
 SCMIO_uint64Str = "UINT64"
 SCMIO_stringStr = "String"
 SCMIO_real32Str = "REAL32"
-'''
-SCMIO_pixDataWaveRawFormat    = "wDataCh{0:d}_raw"
+# Key-value pair line: `<type>,<key>=<value>;` -> (type, key, value)
+SCMIO_kvPairRegex = re.compile(
+    r"^([^,\r\n\x00]*),[ \t]*([^,=\r\n]*)=[ \t]*([^,=;\r\n]*)", re.M
+)
+SCMIO_pixDataWaveRawFormat = "wDataCh{0:d}_raw"
 SCMIO_pixDataWaveDecodeFormat = "wDataCh{0:d}"
-'''
 SCMIO_maxStimBufMapEntries = 128
 SCMIO_maxStimChans = 32
 SCMIO_maxInputChans = 4
@@ -46,6 +61,9 @@ ScM_scanMode_XZYImage = 4  # xz sections stacked along y (x is fastest scanner)
 ScM_scanMode_ZXYImage = 5  # zx sections stacked along y (z is fastest scanner)
 ScM_scanMode_TrajectArb = 6
 ScM_scanMode_XZImage = 7  # ??
+ScM_imageScanModes = [
+    ScM_scanMode_XYImage, ScM_scanMode_XYZImage, ScM_scanMode_XZYImage, ScM_scanMode_ZXYImage
+]
 
 ScM_scanModeStr = [
     "XYImage", "Line",
@@ -63,6 +81,27 @@ ScM_simpleScanFuncList = ["XYScan2", "XYScan3", "XYZScan1", "xzSlice"]
 
 SCMIO_preHeaderSize_bytes = 64
 
+SCMIO_loadMode_read = "read"
+SCMIO_loadMode_mmap = "mmap"
+SCMIO_loadModes = [SCMIO_loadMode_read, SCMIO_loadMode_mmap]
+
+# Size of the sequential blocks read from the pixel data file (see `BlockReader`)
+SCMIO_readBlockSize_byte = 8 * 2 ** 20
+
+# Order of the dimensions of pixel data returned by `SMP.getData`:
+# (frames, lines, pixels) or Igor-compatible (pixels, lines, frames)
+SCMIO_dataOrder_tyx = "tyx"
+SCMIO_dataOrder_xyt = "xyt"
+SCMIO_dataOrders = [SCMIO_dataOrder_tyx, SCMIO_dataOrder_xyt]
+
+# Levels of acquisition timestamps (see `SMP.getTimestamps`)
+SCMIO_timestampLevel_frame = "frame"
+SCMIO_timestampLevel_line = "line"
+SCMIO_timestampLevel_pixel = "pixel"
+SCMIO_timestampLevels = [
+    SCMIO_timestampLevel_frame, SCMIO_timestampLevel_line, SCMIO_timestampLevel_pixel
+]
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
 # Other definitions
 ScM_TTLlow = 0
@@ -97,6 +136,7 @@ ERR_SMH_NoParametersFound = 4
 ERR_CannotReshapePixelData = 5
 ERR_UnknownScanMode = 6
 Err_SMH_NoParametersFound = 7
+ERR_ChannelNotRecorded = 8
 
 ERRStr = [
     "Ok",
@@ -105,7 +145,9 @@ ERRStr = [
     "Invalid .smh object",
     ".smh parameter not found",
     "Cannot reshape pixel data",
-    "Unknown scan mode"
+    "Unknown scan mode",
+    "No parameters found in .smh file",
+    "AI channel `{0}` not recorded"
 ]
 
 
@@ -184,10 +226,8 @@ class SCMIO_keys(Enum):
     USER_NFrPerStep = "NFrPerStep"
     USER_offsetX_V = "XOffset_V"
     USER_offsetY_V = "YOffset_V"
-    '''
     USER_nZPixRetrace = "ZPixRetraceLen"
     USER_usesZForFastScan = "UsesZForFastScan"
-    '''
     USER_Comment = "Comment"
     USER_SetupID = "SetupID"
     USER_LaserWavelen_nm = "LaserWavelength_nm"
@@ -275,23 +315,76 @@ def scm_load_pre_header(fPath, offset=0):
           uint32    analogDataLen_bytes[2] // #7
         EndStructure
     """
-    d = dict()
     # Open file in binary mode to get pre-header
     with open(fPath, "rb") as f:
         if offset > 0:
             f.seek(offset)
-        buf = f.read(SCMIO_preHeaderSize_bytes)
-        hdr = struct.unpack("4H16s5Q", buf)
-        d.update({"fileType": decode_file_type(hdr[0:3])})
-        d.update({"GUID": bytearray(hdr[4]).hex()})
-        d.update({"headerLen_byte": hdr[5]})
-        d.update({"headerLen_values": hdr[6]})
-        d.update({"headerStart_bytes": hdr[7]})
-        d.update({"pixDataLen_byte": hdr[8]})
-        d.update({"analogDataLen_byte": hdr[9]})
+        return scm_unpack_pre_header(f.read(SCMIO_preHeaderSize_bytes))
+
+
+def scm_unpack_pre_header(buf):
+    """ Unpack the pre-header in `buf` (see `scm_load_pre_header`) into a dict
+    """
+    d = dict()
+    hdr = struct.unpack("4H16s5Q", buf)
+    d.update({"fileType": decode_file_type(hdr[0:3])})
+    d.update({"GUID": bytearray(hdr[4]).hex()})
+    d.update({"headerLen_byte": hdr[5]})
+    d.update({"headerLen_values": hdr[6]})
+    d.update({"headerStart_bytes": hdr[7]})
+    d.update({"pixDataLen_byte": hdr[8]})
+    d.update({"analogDataLen_byte": hdr[9]})
     return d
 
 
+def scm_pack_pre_header(fileType, GUID, headerLen_byte=0, headerLen_values=0,
+                        pixDataLen_byte=0, analogDataLen_byte=0):
+    """ Pack a pre-header (see `scm_load_pre_header`) into 64 bytes; `fileType`
+        is e.g. "SMH" or "SMP", `GUID` a hex string (as in the pre-header dict)
+    """
+    ft = [ord(c) for c in fileType[:3].ljust(3, "\x00")] + [0]
+    return struct.pack(
+        "4H16s5Q", *ft, bytes.fromhex(GUID), headerLen_byte, headerLen_values,
+        SCMIO_preHeaderSize_bytes, pixDataLen_byte, analogDataLen_byte
+    )
+
+
+def scm_encode_kv_pairs(kvPairs):
+    """ Encode a list of `(type, key, value)` tuples (with `type` one of the
+        `SCMIO_xxxStr` and `value` a string) into the UTF-16 key-value block
+        of an `.smh` file
+    """
+    s = "\r\n" + "".join(
+        f"{sty},{sKey}={sVal};\r\n" for sty, sKey, sVal in kvPairs
+    ) + "\x00"
+    return s.encode("utf-16-le")
+
+
+def scm_encode_header(kvPairs, GUID, pixDataLen_byte):
+    """ Encode a complete `.smh` file (pre-header and key-value block) from a
+        list of `(type, key, value)` tuples (see `scm_encode_kv_pairs`); the keys
+        with the header length are appended. Returns the bytes of the file and
+        the pre-header dict
+    """
+    nHdr = 0
+    while True:
+        # The header length is part of the header ...
+        kvl = kvPairs + [
+            (SCMIO_uint64Str, SCMIO_keys.HdrLenInValuePairs.value, len(kvPairs) + 2),
+            (SCMIO_uint64Str, SCMIO_keys.HdrLenInBytes.value, nHdr)
+        ]
+        buf = scm_encode_kv_pairs(kvl)
+        if SCMIO_preHeaderSize_bytes + len(buf) == nHdr:
+            break
+        nHdr = SCMIO_preHeaderSize_bytes + len(buf)
+    d = {
+        "GUID": GUID, "headerLen_byte": nHdr, "headerLen_values": len(kvl),
+        "pixDataLen_byte": pixDataLen_byte, "analogDataLen_byte": pixDataLen_byte
+    }
+    preHdr = scm_pack_pre_header("SMH", **d)
+    return preHdr + buf, d
+
+
 def decode_file_type(msg):
     try:
         return bytearray(msg).decode("utf-8")
@@ -301,11 +394,43 @@ def decode_file_type(msg):
 
 
 def scm_log(msg, lf=True):
-    """ Logs a message, currently simply by printing it to the history
+    """ Logs a message with `SCMIO_logger`; messages starting with `ERROR` or
+        `WARNING` are logged with the respective level, all others as INFO. If
+        `SCMIO_VERBOSE` is set, the message is also printed
     """
-    if lf:
-        print(msg)
-    else:
-        print(msg, end="")
+    if SCMIO_VERBOSE:
+        print(msg, end="\n" if lf else "")
+    level = logging.INFO
+    if msg.startswith("ERROR"):
+        level = logging.ERROR
+    elif msg.startswith("WARNING"):
+        level = logging.WARNING
+    SCMIO_logger.log(level, msg)
+
+
+def scm_set_stats_hook(hook):
+    """ Set the function `hook(fPath, stage, statDict)` that receives the statistics
+        of every stage of loading a file (None to remove it)
+    """
+    global SCMIO_statsHook
+    SCMIO_statsHook = hook
+
+
+def scm_report_stage(fPath, stage, dt, nBytes):
+    """ Pass the statistics of a stage of loading file `fPath` to the hook and the
+        logger; returns the statistics as dict
+    """
+    d = {
+        "time_s": dt, "nBytes": nBytes,
+        "MB_per_s": nBytes / 1E6 / dt if dt > 0 else 0.
+    }
+    if SCMIO_statsHook is not None:
+        SCMIO_statsHook(fPath, stage, d)
+    if SCMIO_logger.isEnabledFor(logging.DEBUG):
+        SCMIO_logger.debug(
+            f"`{fPath}` {stage}: {dt * 1E3:.2f} ms, {nBytes / 1E6:.3f} MB "
+            f"({d['MB_per_s']:.1f} MB/s)"
+        )
+    return d
 
 # ----------------------------------------------------------------------------------
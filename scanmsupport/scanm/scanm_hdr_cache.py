@@ -0,0 +1,169 @@
+# ----------------------------------------------------------------------------
+# scanm_hdr_cache.py
+# Cache for parsed ScanM header files (`.smh`)
+#
+# The MIT License (MIT)
+# (c) Copyright 2022-23 Thomas Euler, Jonathan Oesterle
+#
+# 2026-10-17, first implementation
+# ----------------------------------------------------------------------------
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from .scanm_global import *
+
+
+# ----------------------------------------------------------------------------
+class SMHCache(object):
+    """ In-memory and (optionally) on-disk cache of parsed `.smh` headers
+
+        Entries are keyed by path, file size and modification time and contain
+        the parsed key-value pairs and pre-header; on a hit, only the 64-byte
+        pre-header is read to validate the GUID. Both levels are limited (number
+        of entries in memory, bytes on disk) and evict the least recently used
+        entries. Use with `SMH.loadSMH(fName, cache=...)`.
+    """
+
+    def __init__(self, cacheDir=None, maxEntries=1024, maxBytes_disk=256 * 2 ** 20):
+        self._cacheDir = cacheDir
+        self._maxEntries = maxEntries
+        self._maxBytes_disk = maxBytes_disk
+        self._memDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "nHits": 0, "nMisses": 0, "coldLoad_s": 0., "warmLoad_s": 0.
+        }
+        if cacheDir is not None:
+            os.makedirs(cacheDir, exist_ok=True)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def get(self, fPathSMH):
+        """ Return `(preHdrDict, kvPairDict)` for `fPathSMH` or None, if the file
+            is not in the cache or has changed
+        """
+        key = self._getKey(fPathSMH)
+        with self._lock:
+            entry = self._memDict.get(key)
+            if entry is not None:
+                self._memDict.move_to_end(key)
+        if entry is None and self._cacheDir is not None:
+            entry = self._loadFromDisk(key)
+            if entry is not None:
+                self._putInMemory(key, entry)
+        if entry is None:
+            return None
+
+        # Validate entry using the GUID in the pre-header
+        guid, data = entry
+        if scm_load_pre_header(fPathSMH)["GUID"] != guid:
+            self.remove(fPathSMH)
+            return None
+        return pickle.loads(data)
+
+    def put(self, fPathSMH, preHdrDict, kvPairDict):
+        """ Add parsed header of `fPathSMH` to the cache
+        """
+        key = self._getKey(fPathSMH)
+        entry = (preHdrDict["GUID"], pickle.dumps((preHdrDict, kvPairDict)))
+        self._putInMemory(key, entry)
+        if self._cacheDir is not None:
+            self._saveToDisk(key, entry)
+
+    def remove(self, fPathSMH):
+        key = self._getKey(fPathSMH)
+        with self._lock:
+            self._memDict.pop(key, None)
+        if self._cacheDir is not None:
+            try:
+                os.remove(self._getDiskPath(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._memDict.clear()
+        if self._cacheDir is not None:
+            for fName in os.listdir(self._cacheDir):
+                if fName.endswith(".smhc"):
+                    os.remove(os.path.join(self._cacheDir, fName))
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @property
+    def stats(self):
+        """ Number of hits and misses, and mean load times (in s) of `loadSMH`
+            without (cold) and with (warm) cache hit
+        """
+        s = self._stats
+        return {
+            "nHits": s["nHits"],
+            "nMisses": s["nMisses"],
+            "coldLoad_s": s["coldLoad_s"] / s["nMisses"] if s["nMisses"] else 0.,
+            "warmLoad_s": s["warmLoad_s"] / s["nHits"] if s["nHits"] else 0.
+        }
+
+    def addTiming(self, isHit, dt):
+        with self._lock:
+            if isHit:
+                self._stats["nHits"] += 1
+                self._stats["warmLoad_s"] += dt
+            else:
+                self._stats["nMisses"] += 1
+                self._stats["coldLoad_s"] += dt
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _getKey(self, fPathSMH):
+        st = os.stat(fPathSMH)
+        return os.path.abspath(fPathSMH), st.st_size, st.st_mtime_ns
+
+    def _getDiskPath(self, key):
+        h = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self._cacheDir, h + ".smhc")
+
+    def _putInMemory(self, key, entry):
+        with self._lock:
+            self._memDict[key] = entry
+            self._memDict.move_to_end(key)
+            while len(self._memDict) > self._maxEntries:
+                self._memDict.popitem(last=False)
+
+    def _loadFromDisk(self, key):
+        fPath = self._getDiskPath(key)
+        try:
+            with open(fPath, "rb") as f:
+                entry = pickle.load(f)
+            # Mark as recently used
+            os.utime(fPath)
+            return entry
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _saveToDisk(self, key, entry):
+        fPath = self._getDiskPath(key)
+        fPathTmp = f"{fPath}.{os.getpid()}.tmp"
+        with open(fPathTmp, "wb") as f:
+            pickle.dump(entry, f)
+        os.replace(fPathTmp, fPath)
+
+        # Evict least recently used entries, if cache is too large
+        files = []
+        for fName in os.listdir(self._cacheDir):
+            if fName.endswith(".smhc"):
+                try:
+                    st = os.stat(os.path.join(self._cacheDir, fName))
+                    files.append((st.st_mtime, st.st_size, fName))
+                except FileNotFoundError:
+                    pass
+        nBytes = sum(f[1] for f in files)
+        for _, size, fName in sorted(files):
+            if nBytes <= self._maxBytes_disk:
+                break
+            try:
+                os.remove(os.path.join(self._cacheDir, fName))
+            except FileNotFoundError:
+                pass
+            nBytes -= size
+
+# ----------------------------------------------------------------------------
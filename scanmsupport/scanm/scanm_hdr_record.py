@@ -0,0 +1,98 @@
+# ----------------------------------------------------------------------------
+# scanm_hdr_record.py
+# Compact, immutable records of parsed ScanM headers
+#
+# The MIT License (MIT)
+# (c) Copyright 2022-23 Thomas Euler, Jonathan Oesterle
+#
+# 2026-10-17, first implementation
+# ----------------------------------------------------------------------------
+from collections import namedtuple
+
+import numpy as np
+
+from .scanm_global import *
+
+# Scalar header parameters of a record (as `SMH` properties) and their type
+# in the structured array (see `scm_hdr_records_to_array`)
+SCMIO_hdrRecordFields = [
+    ("scanMode", np.int32), ("scanType", np.int32), ("pixSize_byte", np.int32),
+    ("pixDur_us", np.float64), ("pixDurTarget_us", np.float64), ("zoom", np.float64),
+    ("nPixBufPerFr", np.int32), ("nStimBufPerFr", np.int32), ("nImgPerFr", np.int32),
+    ("dxFr_pix", np.int32), ("dyFr_pix", np.int32), ("dzFr_pix", np.int32),
+    ("dxOffs_pix", np.int32), ("dxRetrace_pix", np.int32),
+    ("dxFrDec_pix", np.int32), ("dyFrDec_pix", np.int32), ("dzFrDec_pix", np.int32),
+    ("nStimBuf", np.int32), ("stimChMask", np.int32),
+    ("nInputCh", np.int32), ("inputChMask", np.int32),
+    ("nPixBufsSet", np.int64), ("pixBufCounter", np.int64)
+]
+
+# Parameters of the pixel data geometry (see `SMP._preparePixGeometry`)
+SCMIO_hdrGeometryFields = [
+    ("dFast", np.int32), ("dSlow1", np.int32), ("dSlow2", np.int32),
+    ("nFastPixRetr", np.int32), ("nFastPixOff", np.int32), ("pixBLen", np.int32),
+    ("nBufPerFr", np.int32), ("nPixB", np.int64), ("nAICh", np.int32),
+    ("nImgPerFr", np.int32), ("nFrPerStep", np.int32), ("nFr", np.int64)
+]
+
+
+# ----------------------------------------------------------------------------
+class SMHGeometry(namedtuple("SMHGeometry", [n for n, _ in SCMIO_hdrGeometryFields] + ["chList"])):
+    """ Layout of the pixel data; `chList` are the indices of the recorded AI
+        channels, in the order of the interleaved pixel buffers
+    """
+    __slots__ = ()
+
+    def chIndex(self, ch):
+        # Index of AI channel `ch` in the interleaved pixel buffers
+        return self.chList.index(ch)
+
+
+class SMHRecord(namedtuple("SMHRecord", ["fPath", "GUID"] + [n for n, _ in SCMIO_hdrRecordFields] + ["geometry"])):
+    """ Immutable snapshot of a parsed header (see `SMH.header`) with plain
+        attributes for the frequently used parameters and, if the pixel data
+        geometry could be determined, the `SMHGeometry` as `geometry`
+    """
+    __slots__ = ()
+
+
+# ----------------------------------------------------------------------------
+def scm_make_hdr_record(smh, geomDict=None):
+    """ Create the `SMHRecord` of `smh` (an `SMH` object with loaded header), with
+        the geometry from `geomDict` (see `SMP._pixGeomDict`), if given
+    """
+    geometry = None
+    if geomDict:
+        mask = smh.inputChMask
+        geometry = SMHGeometry(
+            *[int(geomDict[n]) for n, _ in SCMIO_hdrGeometryFields],
+            chList=tuple(i for i in range(SCMIO_maxInputChans) if mask & (2 ** i))
+        )
+    return SMHRecord(
+        smh.filePath, smh.GUID, *[getattr(smh, n) for n, _ in SCMIO_hdrRecordFields],
+        geometry=geometry
+    )
+
+
+def scm_hdr_records_to_array(records):
+    """ Convert a list of `SMHRecord`s into one NumPy structured array (with the
+        fields `fPath`, `GUID`, those of `SCMIO_hdrRecordFields` and, prefixed by
+        `g_`, those of `SCMIO_hdrGeometryFields`), e.g. for vectorized filtering:
+
+            a = scm_hdr_records_to_array(recs)
+            paths = a["fPath"][(a["scanMode"] == ScM_scanMode_XYImage) & (a["g_nFr"] > 100)]
+
+        Undefined values are -1 (integers) or NaN
+    """
+    nPath = max([len(r.fPath) for r in records], default=1)
+    dtype = [("fPath", f"U{nPath}"), ("GUID", "U32")] + SCMIO_hdrRecordFields
+    dtype += [("g_" + n, t) for n, t in SCMIO_hdrGeometryFields]
+    undef = [np.nan if np.dtype(t).kind == "f" else -1 for _, t in dtype]
+    nGeom = len(SCMIO_hdrGeometryFields)
+    rows = []
+    for r in records:
+        row = list(r[:-1]) + (list(r.geometry[:nGeom]) if r.geometry else [None] * nGeom)
+        rows.append(tuple(u if v is None else v for v, u in zip(row, undef)))
+    return np.array(rows, dtype=dtype)
+
+# ----------------------------------------------------------------------------
@@ -0,0 +1,107 @@
+# ----------------------------------------------------------------------------
+# scanm_reader.py
+# Sequential read-ahead reader for pixel data files (`.smp`)
+#
+# The MIT License (MIT)
+# (c) Copyright 2022-23 Thomas Euler, Jonathan Oesterle
+#
+# 2026-10-17, first implementation
+# ----------------------------------------------------------------------------
+import queue
+import threading
+import time
+
+from .scanm_global import *
+
+
+# ----------------------------------------------------------------------------
+class BlockReader(object):
+    """ Reads `nByte` bytes from the open file `f` (starting at the current position)
+        in large sequential blocks of about `block_byte` bytes (a multiple of
+        `align_byte`, e.g. the size of the interleaved pixel buffers), in a background
+        thread that stays up to `nAhead` blocks ahead of the consumer
+
+        Hence, on network file systems with a high latency, reading and processing of
+        the data overlap. Iterating yields the blocks as `memoryview`s into a small set
+        of reused buffers; a block is only valid until the next one is requested:
+
+            reader = BlockReader(f, nByte, block_byte=16 * 2 ** 20, align_byte=bufSize)
+            for buf in reader:
+                data = np.frombuffer(buf, dtype)
+                ...
+            print(reader.stats["MB_per_s"])
+    """
+
+    def __init__(self, f, nByte, block_byte=None, align_byte=1, nAhead=2):
+        block_byte = SCMIO_readBlockSize_byte if block_byte is None else block_byte
+        self._f = f
+        self._nByte = nByte
+        self._block_byte = max(1, block_byte // align_byte) * align_byte
+        self._nAhead = max(1, nAhead)
+        self._stats = {"nBytes": 0, "nBlocks": 0, "read_s": 0., "time_s": 0.}
+
+    def __iter__(self):
+        # Buffers in use: one being consumed, `nAhead` queued and one being filled
+        bufs = [bytearray(min(self._block_byte, self._nByte)) for _ in range(self._nAhead + 2)]
+        q = queue.Queue(maxsize=self._nAhead)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._read, args=(bufs, q, stop), daemon=True)
+        t0 = time.perf_counter()
+        thread.start()
+        try:
+            while True:
+                item = q.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            while thread.is_alive():
+                # Unblock the reader thread, if it waits for a free slot
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                thread.join(0.01)
+            self._stats["time_s"] = time.perf_counter() - t0
+
+    def _read(self, bufs, q, stop):
+        nLeft = self._nByte
+        i = 0
+        try:
+            while nLeft > 0 and not stop.is_set():
+                mv = memoryview(bufs[i % len(bufs)])[:min(self._block_byte, nLeft)]
+                t0 = time.perf_counter()
+                n = self._f.readinto(mv)
+                self._stats["read_s"] += time.perf_counter() - t0
+                assert n == len(mv), "ABORT: End of .smp file, should not happen ..."
+                self._stats["nBytes"] += n
+                self._stats["nBlocks"] += 1
+                nLeft -= n
+                i += 1
+                self._put(q, mv, stop)
+            self._put(q, None, stop)
+        except BaseException as e:
+            self._put(q, e, stop)
+
+    @staticmethod
+    def _put(q, item, stop):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    @property
+    def stats(self):
+        """ Number of bytes and blocks read, time spent in `read` calls and in total
+            (in s) and the achieved read throughput (MB/s, based on the read time)
+        """
+        s = dict(self._stats)
+        s["MB_per_s"] = s["nBytes"] / 1E6 / s["read_s"] if s["read_s"] > 0 else 0.
+        return s
+
+# ----------------------------------------------------------------------------
@@ -7,12 +7,17 @@
 #
 # 2022-01-30, first implementation
 # 2023-06-16, changes to cope with older files
+# 2026-10-17, decode and tokenize the key-value pairs in one go
+# 2026-10-17, immutable header record (`header`)
 # ----------------------------------------------------------------------------
 import os.path
+import time
+from operator import itemgetter
 
 import numpy as np
 
 from .scanm_global import *
+from .scanm_hdr_record import scm_make_hdr_record
 
 
 # ----------------------------------------------------------------------------
@@ -30,9 +35,14 @@ class SMH(object):
         self._kvPairDict = {}
         self._fPath = ""
         self._isSMHReady = False
+        self._stats = dict()
+        self._hdr = None
 
-    def loadSMH(self, fName, verbose=False):
+    def loadSMH(self, fName, verbose=False, cache=None):
         """ Load file `fName`
+
+            `cache` is an optional `SMHCache`; if the header is found there (and
+            the file did not change), only the pre-header is read from the file
         """
         # Clear object if not empty
         if self._isSMHReady:
@@ -49,99 +59,68 @@ class SMH(object):
         else:
             self._fPath = fPath
 
+        t0 = time.perf_counter()
+        if cache is not None:
+            entry = cache.get(fPathSMH)
+            if entry is not None:
+                self._SMHPreHdrDict, self._kvPairDict = entry
+                self._isSMHReady = True
+                self._addStat("cache", t0, SCMIO_preHeaderSize_bytes)
+                cache.addTiming(True, time.perf_counter() - t0)
+                scm_log(f"Header `{fPathSMH}` loaded from cache")
+                return errC
+
         scm_log(f"Processing file `{fPathSMH}`")
         try:
-            # Load pre-header into a dict
-            scm_log("Loading pre-header ...")
-            self._SMHPreHdrDict = scm_load_pre_header(fPathSMH)
-
-            # Load key-value pairs
-            scm_log("Loading parameters (key-value pairs) ...")
-            kvl = []
+            with open(fPathSMH, "rb") as f:
+                # Load pre-header into a dict
+                scm_log("Loading pre-header ...")
+                t = time.perf_counter()
+                self._SMHPreHdrDict = scm_unpack_pre_header(f.read(SCMIO_preHeaderSize_bytes))
+                self._addStat("preHeader", t, SCMIO_preHeaderSize_bytes)
+
+                # Load key-value pairs
+                # (Read the header block following the pre-header and decode it in one
+                #  go (UTF-16, little endian; special characters, such as `µ`, are
+                #  handled by the decoder), then tokenize all key-value pairs at once)
+                scm_log("Loading parameters (key-value pairs) ...")
+                t = time.perf_counter()
+                buf = f.read()
+            self._addStat("kvRead", t, len(buf))
             key_w_err = []
-            nkv = 0
-            done = False
-
-            # Read all lines from header file
-            with open(fPathSMH, "rt", encoding='ISO-8859-1') as f:
-                # Jump the pre-header ...
-                f.seek(SCMIO_preHeaderSize_bytes)
-                while not (done):
-                    ln = f.readline()
-                    done = len(ln) == 0
-                    if not done:
-                        # Line with content
-                        # -> convert to normal string
-                        # (this is a bit complicated because of special characters,
-                        #  such as `µ`)
-                        buf = ln.encode("utf-8")
-                        tmp = ""
-                        ich = -1
-                        for j in range((len(buf) - 1) // 2):
-                            if buf[ich + 1] == 0:
-                                ich += 2
-                                tmp += chr(buf[ich])
-                            else:
-                                ich += 3
-                                tmp = tmp[:-1] + chr(buf[ich - 2]) + chr(buf[ich])
-
-                        s = "".join(tmp).split("\n")[0]
-                        if len(s) > 0 and s[0] != "\x00":
-                            # String is not empty and nd of file not reached
-                            # -> store string in list
-                            if verbose:
-                                scm_log(f"-> {nkv:5} {s}")
-                            kvl.append(s)
-                            nkv += 1
+            t = time.perf_counter()
+            txt = buf[:len(buf) // 2 * 2].decode("utf-16-le", errors="replace")
+            kvl = SCMIO_kvPairRegex.findall(txt)
+            nkv = len(kvl)
+            if verbose:
+                for i, kv in enumerate(kvl):
+                    scm_log(f"-> {i:5} {kv[0]},{kv[1]}={kv[2]}")
             if nkv == 0:
                 errC = Err_SMH_NoParametersFound
-                scm_log(ERRStr(errC))
+                scm_log(ERRStr[errC])
                 return errC
 
-            # Now parse the found key-value pairs
+            # Now parse the found key-value pairs; the pairs are grouped by type
+            # (stable sort) and the values of each type are converted in one go
+            # (see `_convertValues`)
             scm_log(f"{nkv} key-value pair(s) found")
-            for i, s in enumerate(kvl):
-                # Get the different elements of the key-value pair
-                tmp = s.split(SCMIO_typeKeySep)
-                sty = tmp[0]
-                tmp = tmp[1].split(SCMIO_keyValueSep)
-                svr = tmp[0].strip()
-                tmp = [s.strip() for s in tmp[1].split(SCMIO_entrySep) if len(s) > 0]
-                tid = None
-                nvl = 1
-                v = tmp[0]
-
-                # Extract value(s) depending on type
-                if sty == SCMIO_stringStr:
-                    svl = v.split(SCMIO_subEntrySep)
-                    if len(svl) == 1:
-                        svl = svl[0]
-                    else:
-                        nvl = len(svl)
-                    tid = np.character
-                elif sty == SCMIO_real32Str:
-                    svl = float(v)
-                    tid = np.float64
-                elif sty in [SCMIO_uint32Str, SCMIO_uint64Str]:
-                    if not v.lower() == "nan":
-                        try:
-                            svl = int(v)
-                        except ValueError:
-                            # Mark key as erronous
-                            svl = None
-                            scm_log(f"ERROR reading `{svr}` (value is `{v}`)")
-                            key_w_err.append(svr)
-                        tid = np.uint32 if sty == SCMIO_uint32Str else np.uint64
-                    else:
-                        svl = None
-                        tid = np.float64
-                else:
-                    raise NotImplementedError(f"Type `{sty}` not implemented")
-
-                # Add parsed parameter to the parameter dictionary
-                self._kvPairDict.update({svr: [tid, nvl, svl]})
-                if verbose:
-                    scm_log(f"-> {i:5} {s}")
+            types, keys, values = zip(*sorted(kvl, key=itemgetter(0)))
+            keys = list(map(str.rstrip, keys))
+            parsed = dict()
+            i0 = 0
+            for sty in dict.fromkeys(types):
+                i1 = i0 + types.count(sty)
+                el = self._convertValues(sty, keys[i0:i1], values[i0:i1], key_w_err)
+                parsed.update(zip(keys[i0:i1], el))
+                i0 = i1
+
+            # Add parsed parameters to the parameter dictionary, in the order of
+            # the file
+            fileKeys = list(map(str.rstrip, list(zip(*kvl))[1]))
+            self._kvPairDict.update((svr, parsed[svr]) for svr in fileKeys)
+            if verbose:
+                for i, (sty, svr, v) in enumerate(kvl):
+                    scm_log(f"-> {i:5} {sty},{fileKeys[i]}={v.rstrip()}")
 
             # Report and correct errors, if any
             if len(key_w_err) > 0:
@@ -193,7 +172,7 @@ class SMH(object):
                  })
 
             # Retrieve stimulus buffer map
-            StimBufMapEntr = np.array([[0] * SCMIO_maxStimBufMapEntries] * SCMIO_maxStimChans)
+            StimBufMapEntr = np.zeros((SCMIO_maxStimChans, SCMIO_maxStimBufMapEntries), dtype=int)
             mask = self.get(SCMIO_keys.StimulusChannelMask)
             for iCh in range(SCMIO_maxStimChans):
                 if mask & (1 << iCh):
@@ -300,12 +279,74 @@ class SMH(object):
 
             scm_log(f"{len(self._kvPairDict)} parameter(s) extracted")
             self._isSMHReady = True
+            if cache is not None:
+                # Cache the parameters as read from the file, i.e. before they are
+                # corrected along with the pixel data geometry (see `header`),
+                # because this is repeated on a cache hit
+                cache.put(fPathSMH, self._SMHPreHdrDict, self._kvPairDict)
+            self._addStat("kvParse", t, len(buf))
+            if cache is not None:
+                cache.addTiming(False, time.perf_counter() - t0)
             scm_log("Done.")
 
         except:
             raise
         return errC
 
+    @staticmethod
+    def _convertValues(sty, keys, values, key_w_err):
+        """ Convert the values (strings) of the keys `keys`, all of type `sty`, and
+            return a list of `[type, number of values, value(s)]` entries; keys with
+            values that cannot be converted are added to `key_w_err`
+        """
+        if sty == SCMIO_stringStr:
+            svll = [v.rstrip().split(SCMIO_subEntrySep) for v in values]
+            return [
+                [np.character, 1, svl[0]] if len(svl) == 1 else [np.character, len(svl), svl]
+                for svl in svll
+            ]
+        if sty == SCMIO_real32Str:
+            return [[np.float64, 1, v] for v in map(float, values)]
+        if sty not in [SCMIO_uint32Str, SCMIO_uint64Str]:
+            raise NotImplementedError(f"Type `{sty}` not implemented")
+
+        tid = np.uint32 if sty == SCMIO_uint32Str else np.uint64
+        try:
+            return [[tid, 1, v] for v in map(int, values)]
+        except ValueError:
+            pass
+        # Undefined (`nan`) or erroneous values, convert one by one
+        res = []
+        for svr, v in zip(keys, values):
+            try:
+                res.append([tid, 1, int(v)])
+                continue
+            except ValueError:
+                v = v.rstrip()
+            if v.lower() == "nan":
+                res.append([np.float64, 1, None])
+            else:
+                # Mark key as erronous
+                scm_log(f"ERROR reading `{svr}` (value is `{v}`)")
+                key_w_err.append(svr)
+                res.append([tid, 1, None])
+        return res
+
+    def _freezeHeader(self):
+        """ Create the immutable record of the header (see `header`)
+        """
+        self._hdr = scm_make_hdr_record(self)
+
+    def _addStat(self, stage, t0, nBytes=0):
+        """ Add the time since `t0` and the number of bytes processed to the statistics
+            of `stage` and report them (see `scm_report_stage`)
+        """
+        dt = time.perf_counter() - t0
+        s = self._stats.setdefault(stage, {"time_s": 0., "nBytes": 0})
+        s["time_s"] += dt
+        s["nBytes"] += nBytes
+        scm_report_stage(self._fPath, stage, dt, nBytes)
+
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     ''' General information
     '''
@@ -322,6 +363,27 @@ class SMH(object):
     def isSMHReady(self):
         return self._isSMHReady
 
+    @property
+    def header(self):
+        """ Immutable record (`SMHRecord`) of the header with the frequently used
+            parameters (and, for `SMP`, the pixel data geometry) as plain attributes;
+            it is created on first access and again after `set`
+        """
+        if self._hdr is None and self._isSMHReady:
+            self._freezeHeader()
+        return self._hdr
+
+    @property
+    def stats(self):
+        """ Wall time (in s), number of bytes and throughput (in MB/s) of the stages
+            of loading the file(s), e.g. "preHeader", "kvRead", "kvParse" and (for
+            `SMP`) "postHeader", "pixRead" (or "pixMap") and "reshape"
+        """
+        return {
+            stage: dict(s, MB_per_s=s["nBytes"] / 1E6 / s["time_s"] if s["time_s"] > 0 else 0.)
+            for stage, s in self._stats.items()
+        }
+
     ''' Scan mode and type
     '''
 
@@ -551,6 +613,7 @@ class SMH(object):
             data = self._kvPairDict[key]
             data[2] = val
             self._kvPairDict[key] = data
+            self._hdr = None
         except KeyError:
             scm_log(f"ERROR: Key `{key}` not found ")
 
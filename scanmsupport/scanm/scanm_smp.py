@@ -7,12 +7,17 @@
 #
 # 2022-01-31, first implementation
 # 2023-06-16, changes to cope with older files
+# 2026-10-17, memory-mapped pixel data (`mode="mmap"`)
 # -------------------------------------------------------------------------------------------
 import os.path
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
 from .scanm_global import *
+from .scanm_hdr_record import scm_make_hdr_record
+from .scanm_reader import BlockReader
 from .scanm_smh import SMH
 from .scanm_stim_buf import StimBuf
 
@@ -31,6 +36,16 @@ class SMP(SMH):
     """
         self._isSMPReady = False
         self._SMPPreHdrDict = dict()
+        self._pixGeomDict = dict()
+        self._pixGeomErrC = None
+        self._pixGeomErrStr = ""
+        self._wPixData = []
+        self._wPixVar = []
+        self._wPixGathered = dict()
+        self._nFrPolledDict = dict()
+        self._isSMPFinal = False
+        self._StimBuf = None
+        self._readStats = dict()
         super()._reset()
 
     '''
@@ -38,9 +53,36 @@ class SMP(SMH):
     def loadSMH(self, fName, verbose=False):  
     '''
 
-    def loadSMP(self, verbose=False):
+    def _freezeHeader(self):
+        """ Create the immutable record of the header, including the pixel data
+            geometry, if it can be determined (see `SMH.header`); invalid geometries
+            are not reported here, but by `loadSMP`
+        """
+        geomDict = self._pixGeomDict if self._preparePixGeometry(quiet=True) == ERR_Ok else None
+        self._hdr = scm_make_hdr_record(self, geomDict)
+
+    def loadSMP(self, verbose=False, mode=SCMIO_loadMode_read, channels=None,
+                zStackVar=False, block_byte=None):
         """ Load pixel data file for the respective `smh` object
+
+            `mode` selects how the pixel data is accessed:
+            - "read" : pixel buffers are read and copied into one array per AI channel
+            - "mmap" : the file is memory-mapped; each AI channel is a strided view into the
+                       interleaved pixel buffers, nothing is read until the data is accessed
+
+            `channels` is an optional list of AI channel indices to load (default: all
+            channels in `inputChMask`); the other channels are skipped when reading the
+            interleaved pixel buffers and `getData` returns None for them
+
+            Z-stacks with more than one frame per step (`NFrPerStep`) are averaged while
+            reading (in both modes), `getData` returns one averaged plane per step. If
+            `zStackVar` is True, also the variance per step is kept (see `getVariance`)
+
+            In "read" mode, the pixel buffers are read sequentially in blocks of about
+            `block_byte` bytes (default: `SCMIO_readBlockSize_byte`) by a background
+            thread; the achieved throughput is available as `readStats`
         """
+        assert mode in SCMIO_loadModes, f"ABORT: Invalid load mode `{mode}`"
         # Clear object if not empty
         if self._isSMPReady:
             self._reset()
@@ -54,8 +96,17 @@ class SMP(SMH):
             scm_log(f"ERROR: File `{fPathSMP}` not found")
             return ERR_FileNotFound
 
+        # Check requested AI channels
+        hdr = self.header
+        recChList = [i for i in range(SCMIO_maxInputChans) if hdr.inputChMask & (2 ** i)]
+        self._chList = recChList if channels is None else sorted(set(channels))
+        for iInCh in self._chList:
+            if iInCh not in recChList:
+                scm_log("ERROR: " + ERRStr[ERR_ChannelNotRecorded].format(iInCh))
+                return ERR_ChannelNotRecorded
+
         # Check for currently implemented scanModes
-        if not (self.scanMode in [ScM_scanMode_XYImage, ScM_scanMode_XZYImage]):
+        if not (self.scanMode in ScM_imageScanModes):
             s = ScM_scanModeStr[self.scanMode]
             scm_log("ERROR: " + ERRStr[ERR_NotImplemented].format(s))
             return ERR_NotImplemented
@@ -77,11 +128,6 @@ class SMP(SMH):
         # Get stim buffer information
         self._StimBuf = StimBuf(self)
 
-        # Get some scanMode-related parameters
-        nFrPerStep = self.get(SCMIO_keys.USER_NFrPerStep)
-        isAvZStack = self.scanType == ScM_scanType_zStack and nFrPerStep > 1
-        nFrPerStep = nFrPerStep if isAvZStack else 1
-
         errC = ERR_Ok
         scm_log(f"Processing file `{fPathSMP}`")
         try:
@@ -91,9 +137,11 @@ class SMP(SMH):
             #  if the GUIDs there match between the two files, on can be sure that the files belong
             #  together.)
             scm_log("Loading post-header ...")
+            t = time.perf_counter()
             self._SMPPreHdrDict = scm_load_pre_header(
                 fPathSMP, self._SMHPreHdrDict["analogDataLen_byte"]
             )
+            self._addStat("postHeader", t, SCMIO_preHeaderSize_bytes)
             gp = self._SMPPreHdrDict["GUID"]
             gh = self._SMHPreHdrDict["GUID"]
 
@@ -102,81 +150,17 @@ class SMP(SMH):
                 scm_log(f"WARNING: GUID mismatch {gh} != {gp}")
 
             # Prepare reading pixel data
-            errC = ERR_Ok
-            if self.scanMode in [ScM_scanMode_XYImage, ScM_scanMode_TrajectArb]:
-                dFast = self.dxFr_pix
-                nFastPixRetr = self.dxRetrace_pix
-                nFastPixOff = self.dxOffs_pix
-                dSlow1 = self.dyFr_pix if self.dyFr_pix > 0 else 1
-                dSlow2 = self.dzFr_pix if self.dzFr_pix > 0 else 1
-                if self.scanMode == ScM_scanMode_TrajectArb:
-                    # TODO
-                    pass
-
-            elif self.scanMode == ScM_scanMode_XZYImage:
-                dFast = self.dxFr_pix
-                nFastPixRetr = self.dxRetrace_pix
-                nFastPixOff = self.dxOffs_pix
-                dSlow1 = self.dzFr_pix if self.dzFr_pix > 0 else 1
-                dSlow2 = self.dyFr_pix if self.dyFr_pix > 0 else 1
-
-            elif self.scanMode == ScM_scanMode_ZXYImage:
-                errC = ERR_NotImplemented
-                """
-        dFast = pwNP[%User_dzPix]
-        nFastPixRetr = pwNP[%User_nPixRetrace]
-        nFastPixOff = pwNP[%User_nZPixLineOffs]
-        dSlow1 = pwNP[%User_dxPix]
-        dSlow2 = pwNP[%User_dyPix]
-        """
-            # ***************
-            # ***************
-            else:
-                errC = ERR_UnknownScanMode
-
+            errC = self._preparePixGeometry()
             if errC != ERR_Ok:
-                s = "ERROR: " + ERRStr[errC]
-                if errC == ERR_NotImplemented:
-                    s = s.format(ScM_scanModeStr[self.scanMode])
-                scm_log(s)
                 return errC
+            g = self._pixGeomDict
+            dFast, dSlow1, dSlow2 = g["dFast"], g["dSlow1"], g["dSlow2"]
+            nFastPixRetr, nFastPixOff = g["nFastPixRetr"], g["nFastPixOff"]
+            pixBLen, nPixB, nAICh = g["pixBLen"], g["nPixB"], g["nAICh"]
+            nImgPerFr, _dtype = g["nImgPerFr"], g["dtype"]
+            nFrPerStep, isAvZStack = g["nFrPerStep"], g["isAvZStack"]
 
-            # Check pixel size
-            assert self.pixSize_byte in [2, 8], "ABORT: Invalid pixel size"
-            _dtype = np.double if self.pixSize_byte == 8 else np.uint16
-
-            # Correct number of pixel buffers, because it is not correctly reported
-            # by the ScanM.dll if one stimulus buffer contained the data for multiple
-            # frames (i.e. cp.stimBufPerFr != 1)
-            if self.nStimBufPerFr > 0:
-                self.nPixBufsSet *= self.nStimBufPerFr
-                self.pixBufCounter *= self.nStimBufPerFr
-
-            # Determine some parameters
-            pixBLen = self.pixBufLenList[0]
-            nPixPerFr = dFast * dSlow1 * dSlow2
-            nBufPerFr = nPixPerFr / pixBLen
-            if self.nPixBufsSet == self.pixBufCounter:
-                nPixB = self.nPixBufsSet * nBufPerFr
-            else:
-                nPixB = (self.nPixBufsSet - self.pixBufCounter) * nBufPerFr
-            nPixB = int(nPixB * nFrPerStep)
-            nAICh = int(self.nInputCh)
-            nImgPerFr = max(1, self.nImgPerFr)
-            self._nFr = int((nPixB / nFrPerStep * pixBLen) / nPixPerFr * nImgPerFr)
-            assert nImgPerFr == 1, "ABORT: `nImgPerFr` larger than 1??"
-
-            # Correct decoded frame size in case of bidrectional scans
-            if nImgPerFr > 1:
-                if self.scanMode == ScM_scanMode_XZYImage:
-                    self.dyFrDec_pix /= nImgPerFr
-
-            dxFrDec = self.dxFrDec_pix
-            dyFrDec = self.dyFrDec_pix
-            dzFrDec = self.dzFrDec_pix
-            nPixDecFr = dxFrDec * dyFrDec  # *dzFrDec
-
-            scm_log(f"{nAICh} AI channel(s) ({self.inputChMask:#04b})")
+            scm_log(f"{nAICh} AI channel(s) ({hdr.inputChMask:#04b}), loading {self._chList}")
             scm_log(f"{nPixB:.0f} of {self.nPixBufsSet} buffer(s) (each {pixBLen} pixels) "
                     "per channel")
 
@@ -185,22 +169,29 @@ class SMP(SMH):
                     self._StimBuf.isExtScanFunction and
                     self._StimBuf.pixDecodeMode == ScM_PixDataDecoded
             )
-            """if self._hasDecoded:
-                # ***************
-                # ***************
-                # TODO
-                # ***************
-                # ***************
-                scm_log("ERROR: " + ERRStr[ERR_NotImplemented].format("Pixel decoding"))
-                return ERR_NotImplemented
-"""
+            decoder = self._StimBuf.decoder
+            if self._StimBuf.isExtScanFunction:
+                s = None
+                if decoder is None:
+                    s = f"Decoder for `{self._StimBuf.scanFuncName}`"
+                elif isAvZStack or nImgPerFr > 1:
+                    s = "Decoders for z-stacks or multiple images per frame"
+                if s is not None:
+                    scm_log("ERROR: " + ERRStr[ERR_NotImplemented].format(s))
+                    return ERR_NotImplemented
+
             self._wPixData = []
-            self._wDataCh = []
-            self._wDecode = np.zeros(nPixDecFr) if self._hasDecoded else None
-            self._wDecodeAv = np.zeros(nPixDecFr) if self._hasDecoded else None
+            self._isMapped = (
+                    mode == SCMIO_loadMode_mmap and not isAvZStack and
+                    (decoder is None or self._StimBuf.pixIdx is not None)
+            )
+            self._wPixVar = []
+            self._frShape = g["frShape"]
+            if decoder is not None:
+                self._frShape = (self._nFr,) + tuple(decoder.frShape)
 
             for iInCh in range(SCMIO_maxInputChans):
-                if self.inputChMask & (2 ** iInCh):
+                if iInCh in self._chList:
                     # Original explanation:
                     # "wDataChx_raw" contains the raw pixel data, "wDataChx" the decoded pixel
                     # data that can be directly used for traditional preprocessing. With standard
@@ -209,139 +200,95 @@ class SMP(SMH):
                     # are created
                     # -> pwPixData
                     n = int(nPixB / nFrPerStep * pixBLen)
-                    self._wPixData.append([iInCh, np.zeros(n, _dtype)])
-                    if self._hasDecoded:
-                        self._wDataCh.append([iInCh, np.zeros((dxFrDec, dyFrDec, self._nFr))])
+                    if decoder is not None and not self._isMapped:
+                        # Decoded (resorted or reconstructed) frames
+                        self._wPixData.append([iInCh, np.zeros(self._frShape, decoder.dtype)])
+                    elif isAvZStack:
+                        # Averaged planes
+                        self._wPixData.append([iInCh, np.zeros(n)])
+                        if zStackVar:
+                            self._wPixVar.append([iInCh, np.zeros(self._frShape)])
+                    elif not self._isMapped:
+                        self._wPixData.append([iInCh, np.zeros(n, _dtype)])
 
 
+            if self._isMapped:
+                # Map pixel data instead of reading it
+                t = time.perf_counter()
+                self._mapPixData(fPathSMP, nPixB, nAICh, pixBLen, _dtype)
+                self._addStat("pixMap", t)
+                scm_log(f"{nPixB} pixel bufs of {nPixB} mapped.")
 
-            # Read pixel data
-            with open(fPathSMP, "rb") as f:
-                # Load pixel data buffer by buffer in the AI channel waves
-                iPixB = 0
-                iPixBAllCh = 0
-                iAvFr = 0
-                isExtSPF = self._StimBuf.isExtScanFunction
-                isDecoded = self._StimBuf.pixDecodeMode == ScM_PixDataDecoded
-                wTempMoreParam = [0] * 7
+            else:
+                # Read pixel data
+                t = time.perf_counter()
+                with open(fPathSMP, "rb") as f:
+                    # Load pixel data into the AI channel waves
+                    iPixBPerCh = -1
+                    if decoder is not None:
+                        # External scan path function, decode blocks of frames
+                        self._decodeFrames(f)
+                        iPixBPerCh = nPixB - 1
 
-                if isAvZStack:
-                    # Is z-stack with more than one frame per step, requires
-                    # averaging ...
-                    # ***************
-                    # ***************
-                    # TODO
-                    # ***************
-                    # ***************
-                    scm_log("ERROR: " + ERRStr[ERR_NotImplemented].format("Z-stacks"))
-                    return ERR_NotImplemented
+                    elif isAvZStack:
+                        # Is z-stack with more than one frame per step, requires
+                        # averaging ...
+                        if nImgPerFr > 1:
+                            s = "Averaging z-stacks with multiple images"
+                            scm_log("ERROR: " + ERRStr[ERR_NotImplemented].format(s))
+                            return ERR_NotImplemented
+                        self._averageZStack(f)
+                        iPixBPerCh = nPixB - 1
 
-                else:
-                    # w/o frame averaging (as usual)
-                    npx = int(pixBLen * nAICh)
-                    sup = f"{npx}H" if self.pixSize_byte == 2 else f"{npx}d"
-
-                    iPixBPerCh = 0
-                    eof = False
-                    for iPixBPerCh in range(nPixB):
-                        # Read next pixel buffer (containing all AI channels)
-                        _size_req = npx * self.pixSize_byte
-                        buf = f.read(_size_req)
-                        _size_read = len(buf)
-                        eof = _size_read < _size_req
-                        if eof:
-                            # End of file reached ...
-                            assert False, "ABORT: End of .smp file, should not happen ..."
-
-                        self._wPixBAllCh = np.array(struct.unpack(sup, buf))
-                        iCh = 0
-                        for iInCh in range(SCMIO_maxInputChans):
-                            if self.inputChMask & (2 ** iInCh):
-                                self._wPixB = np.array(self._wPixBAllCh[iCh * pixBLen:(iCh + 1) * pixBLen])
-                                if self._hasDecoded or not (self._StimBuf.isExtScanFunction):
-                                    # Standard scan path function was used or external scan path function
-                                    # with pixel decoding
-                                    j = 0
-                                    while not self._wPixData[j][0] == iInCh and j < SCMIO_maxInputChans: j += 1
-                                    m = iPixBPerCh * pixBLen
-                                    n = (iPixBPerCh + 1) * pixBLen
-                                    self._wPixData[j][1][m:n] = self._wPixB[:]
-
-                                if self._StimBuf.isExtScanFunction:
-                                    # External scan path function, therefore call the decoder to fill
-                                    # the second set of pixel data waves
-                                    # ***************
-                                    # ***************
-                                    # TODO
-                                    # ***************
-                                    # ***************
-                                    scm_log("ERROR: " + ERRStr[ERR_NotImplemented].format("External decoder functions"))
-                                    return ERR_NotImplemented
-                                    '''
-                  wTempMoreParam[0] = nAICh
-                  wTempMoreParam[1] = iCh
-                  wTempMoreParam[2] = iPixBAllCh *PixBLen
-                  wTempMoreParam[3] = nPixPerFr	 /nImgPerFr
-                  wTempMoreParam[4] = PixBLen
-                  wTempMoreParam[5] = 1
-                  wTempMoreParam[6] = 0
-                  fDecode(wDecode, wDecodeAv, pwPixBAllCh, "root:" +sDFName +":", wTempMoreParam)
-
-                  // Copy pixel data from temporary frame into pixel data wave
-                  //
-                  sprintf sWave, sPixDataDecodeFormat, iInCh
-                  wave pwPixData = $(sWave)
-
-                  if(isDecoded)
-                    // Decoder decoded/reconstructed the data (non loss-less)
-                    //
-                    Redimension/E=1/N=(dxFrDecode, dyFrDecode) wDecode
-                    iImg = trunc(iPixBPerCh /(nBufPerFr *nImgPerFr))
-                    pwPixData[][][iImg] = wDecode[p][q]
-                    Redimension/E=1/N=(dxFrDecode *dyFrDecode) wDecode
-
-                  else
-                    // Decoder just resorted the pixel data
-                    //
-                    Redimension/E=1/N=(dxFrDecode *dyFrDecode *nFr *nImgPerFr) pwPixData
-                    isFlipped = (mod(trunc(iPixBPerCh /nImgPerFr), 2) && (nImgPerFr > 1))
-                    iBufInImg = mod(iPixBPerCh, nBufPerFr /nImgPerFr)
-                    if(isFlipped)
-                      m = (iPixBPerCh +1 -iBufInImg*2) *PixBLen
-                      n = m +PixBLen -1
-                      offsInBuf = mod(iPixBPerCh +1, nBufPerFr/nImgPerFr)*PixBLen
-                    else
-                      m = iPixBPerCh *PixBLen
-                      n = m +PixBLen -1
-                      offsInBuf = iBufInImg *PixBLen
-                    endif
-
-                    pwPixData[m,n] = wDecode[p -m +offsInBuf]
-                    Redimension/E=1/N=(dxFrDecode, dyFrDecode, nFr *nImgPerFr) pwPixData
-                  endif
-                endif
-                '''
-                                iPixB += 1
-                                iCh += 1
-
-                        iPixBAllCh += 1
-
-            # Done reading
-            scm_log(f"{iPixBPerCh + 1} pixel bufs of {nPixB} read.")
+                    else:
+                        # w/o frame averaging (as usual); the pixel buffers are read in
+                        # large blocks in the background and copied into the AI channel
+                        # waves, while the next block is read
+                        bufSize_byte = g["bufSize_byte"]
+                        reader = BlockReader(
+                            f, nPixB * bufSize_byte, block_byte, align_byte=bufSize_byte
+                        )
+                        iChList = [recChList.index(ch) for ch in self._chList]
+                        wPixBList = [d.reshape((-1, pixBLen)) for _, d in self._wPixData]
+                        iPixBPerCh = -1
+                        for buf in reader:
+                            pixB = np.frombuffer(buf, dtype=_dtype).reshape((-1, nAICh, pixBLen))
+                            m = iPixBPerCh + 1
+                            for j, iCh in enumerate(iChList):
+                                wPixBList[j][m:m + len(pixB)] = pixB[:, iCh]
+                            iPixBPerCh += len(pixB)
+                        self._readStats = reader.stats
+                        scm_log(
+                            f"{self._readStats['nBytes'] / 1E6:.1f} MB read in "
+                            f"{self._readStats['nBlocks']} block(s) "
+                            f"({self._readStats['MB_per_s']:.1f} MB/s)"
+                        )
+
+                # Done reading
+                self._addStat("pixRead", t, (iPixBPerCh + 1) * g["bufSize_byte"])
+                scm_log(f"{iPixBPerCh + 1} pixel bufs of {nPixB} read.")
 
             # Post-process data waves according to user settings
+            t = time.perf_counter()
             isFirst = 1
             for iInCh in range(SCMIO_maxInputChans):
-                if self.inputChMask & (2 ** iInCh):
+                if iInCh in self._chList:
 
                     # Reshape AI channel pixel waves
                     errC = ERR_Ok
-                    if self.scanMode in [ScM_scanMode_XYImage, ScM_scanMode_XZYImage, ScM_scanMode_ZXYImage]:
+                    if self.scanMode in ScM_imageScanModes:
                         j = 0
                         while not self._wPixData[j][0] == iInCh and j < SCMIO_maxInputChans: j += 1
                         try:
-                            self._wPixData[j][1].shape = (self._nFr, int(dSlow1 / nImgPerFr), dFast)
-                        except ValueError:
+                            if self._isMapped:
+                                # Mapped channels stay buffer-shaped views (see `_getFrData`),
+                                # only check that they can be reshaped
+                                assert self._wPixData[j][1].size == np.prod(g["frShape"])
+                            else:
+                                self._wPixData[j][1].shape = self._frShape
+                                if g["lineIdx"] is not None and decoder is None:
+                                    self._sortLinesInPlace(self._wPixData[j][1])
+                        except (ValueError, AssertionError):
                             errC = ERR_CannotReshapePixelData
                     # ***************
                     # ***************
@@ -353,8 +300,6 @@ class SMP(SMH):
             nFr = (nPixB/nFrPerStep*PixBLen) /(nPixPerFr) *nImgPerFr
             Redimension/E=1/N=(dFast, dSlow1/nImgPerFr, nFr) pwPixData
             '''
-                    elif self.scanMode == ScM_scanMode_XYZImage:
-                        errC = ERR_NotImplemented
                     # ***************
                     # ***************
                     else:
@@ -367,6 +312,13 @@ class SMP(SMH):
                         scm_log(s)
                         return errC
 
+            self._addStat("reshape", t)
+
+            if decoder is not None:
+                # Decoded frames have no retrace and offset
+                dFast = self._frShape[-1]
+                nFastPixRetr = nFastPixOff = 0
+
             # Save some variables for later use in properties and such
             self._dFast = dFast
             self._nFastPixRetr = nFastPixRetr
@@ -386,20 +338,847 @@ class SMP(SMH):
     def isSMPReady(self):
         return self._isSMPReady
 
-    def getData(self, ch=0, crop=False):
-        # Return data for the AIn channel `ch` or None, if channel does not exist.
-        # if `crop` is True, then crop to imaging region
-        for j in range(SCMIO_maxInputChans):
+    @property
+    def channels(self):
+        # List of loaded AI channels
+        return [ch for ch, _ in self._wPixData]
+
+    def getData(self, ch=0, crop=False, order=SCMIO_dataOrder_tyx, dtype=None,
+                contiguous=False):
+        """ Return data for the AIn channel `ch` or None, if channel does not exist
+            or was not loaded. If `crop` is True, then crop to imaging region (along
+            the fast scan axis). Frames are `(t, y, x)`, volumes (XYZ and ZXY scans)
+            `(t, z, y, x)`
+
+            `order` selects the order of the dimensions (see `SCMIO_dataOrders`),
+            e.g. "xyt" is the layout of the Igor waves (`wDataChX`). By default, a
+            view into the pixel data is returned, whenever possible. If `dtype` is
+            given (and differs from the pixel data type) or `contiguous` is True,
+            a new C-contiguous array is created in a single pass (cropping,
+            reordering and type conversion); with `mode="mmap"`, this array is
+            the only copy of the channel in memory
+
+            With `mode="mmap"`, the frames of a channel are gathered from the pixel
+            buffers if they are not contiguous in the file (e.g. several AI channels
+            and pixel buffers per frame); this read-only array is kept, hence, only
+            the first call (per channel) pays for the gather
+        """
+        assert order in SCMIO_dataOrders, f"ABORT: Invalid order `{order}`"
+        for j in range(len(self._wPixData)):
             if self._wPixData[j][0] == ch:
-                if not crop:
-                    return self._wPixData[j][1]
+                if self.scanMode not in ScM_imageScanModes:
+                    assert False, "ABORT: Should not happen"
+                x0, x1 = 0, self._dFast
+                if crop:
+                    x0, x1 = self._nFastPixOff, self._dFast - self._nFastPixRetr
+
+                pixDType = self._wPixData[j][1].dtype
+                dtype = pixDType if dtype is None else np.dtype(dtype)
+                if not contiguous and dtype == pixDType:
+                    data = self._toDecOrder(self._getFrData(j, keep=True)[..., x0:x1])
                 else:
-                    if self.scanMode in [
-                        ScM_scanMode_XYImage, ScM_scanMode_XZYImage, ScM_scanMode_ZXYImage
-                    ]:
-                        return self._wPixData[j][1][:, :, self._nFastPixOff:-self._nFastPixRetr]
-                    else:
-                        assert False, "ABORT: Should not happen"
+                    data = self._copyFrData(j, x0, x1, dtype, order)
+                return data.T if order == SCMIO_dataOrder_xyt else data
+        return None
+
+    def getTriggers(self, ch=2, threshold=None, min_gap=1, chunk_byte=32 * 2 ** 20):
+        """ Detect the rising edges of the trigger signal in AI channel `ch` and return
+            `(pixIdx, frIdx, t_s)`, i.e. the indices of the trigger pixels in the raw,
+            uncropped trace (in the order the pixels were recorded), the indices of the
+            frames that contain them and their times in seconds (from `pixDur_us`), or
+            None, if the channel does not exist
+
+            A trigger is a sample `>= threshold` preceded by one `< threshold` (default:
+            halfway between minimum and maximum of the trace, which requires an extra
+            pass). Triggers closer than `min_gap` samples to the previous trigger are
+            ignored. The trace is processed in blocks of about `chunk_byte` bytes, taken
+            from the loaded pixel data (if in recording order) or read from the `.smp`
+            file otherwise (e.g. if `loadSMP` was not called)
+        """
+        if not self._prepareFrameAccess(ch):
+            return None
+        g = self._pixGeomDict
+        nPixPerFr = int(np.prod(g["frShape"][1:]))
+        chunk = max(nPixPerFr, chunk_byte // np.dtype(g["dtype"]).itemsize)
+
+        if threshold is None:
+            lo, hi = np.inf, -np.inf
+            for _, trace in self._iterRawTrace(ch, chunk):
+                lo, hi = min(lo, trace.min()), max(hi, trace.max())
+            threshold = (float(lo) + float(hi)) / 2
+
+        # Rising edges, also across the borders of the blocks
+        edgeList = []
+        isHigh = True
+        for i0, trace in self._iterRawTrace(ch, chunk):
+            x = trace >= threshold
+            if x[0] and not isHigh:
+                edgeList.append(np.array([i0]))
+            edgeList.append(np.flatnonzero(x[1:] & ~x[:-1]) + (i0 + 1))
+            isHigh = x[-1]
+        edges = np.concatenate(edgeList) if edgeList else np.zeros(0, np.int64)
+
+        if min_gap > 1 and len(edges) > 1:
+            # Only triggers that are at least `min_gap` samples after the previous one
+            keep = []
+            i = 0
+            while i < len(edges):
+                keep.append(i)
+                i = np.searchsorted(edges, edges[i] + min_gap)
+            edges = edges[keep]
+
+        frIdx = edges // nPixPerFr
+        return edges, frIdx, edges * (self.pixDur_us * 1E-6)
+
+    def getTimestamps(self, level=SCMIO_timestampLevel_pixel, crop=True, dense=False):
+        """ Return the acquisition times (in s, from the start of the recording) of the
+            frames, lines or pixels (`level`, see `SCMIO_timestampLevels`) of the data
+            returned by `getData(ch, crop)`, or None, if not possible
+
+            The times are computed from `pixDur_us` and the pixel data geometry and
+            returned as tuple of compact arrays that broadcast to the shape of the data
+            and add up to the timestamps: the frame (or volume) offsets, followed by the
+            offsets along the slow axes (level "line" and "pixel") and along the fast
+            axis (level "pixel"), e.g. for xy scans `(nFr, 1, 1)`, `(1, nLines, 1)` and
+            `(1, 1, nX)` arrays. Only if `dense` is True, their sum is returned as one
+            array of the size of the data. For averaged z-stacks, the times refer to the
+            first frame of each step
+        """
+        assert level in SCMIO_timestampLevels, f"ABORT: Invalid level `{level}`"
+        if self._preparePixGeometry() != ERR_Ok:
+            return None
+        if self._StimBuf is None:
+            self._StimBuf = StimBuf(self)
+        g = self._pixGeomDict
+        sb = self._StimBuf
+        pixDur_s = self.pixDur_us * 1E-6
+        rawShape = g["frShape"]
+        nFr = rawShape[0]
+        nPixPerFr = int(np.prod(rawShape[1:]))
+        nDim = len(rawShape)
+
+        def _axis(v, iDim):
+            # Offsets `v` as array along dimension `iDim`
+            shape = [1] * nDim
+            shape[iDim] = len(v)
+            return np.reshape(v, shape)
+
+        terms = [_axis(np.arange(nFr) * (nPixPerFr * g["nFrPerStep"] * pixDur_s), 0)]
+        if sb.isExtScanFunction:
+            if level != SCMIO_timestampLevel_frame:
+                if sb.pixIdx is None:
+                    s = f"Pixel timestamps for `{sb.scanFuncName}`"
+                    scm_log("ERROR: " + ERRStr[ERR_NotImplemented].format(s))
+                    return None
+                # Resorted pixels, time is given by the position in the recorded frame
+                terms.append(sb.pixIdx[np.newaxis] * pixDur_s)
+
+        else:
+            if level != SCMIO_timestampLevel_frame:
+                # Slow axes, in the order of the pixel buffers
+                stride = rawShape[-1]
+                for iDim in range(nDim - 2, 0, -1):
+                    terms.append(_axis(np.arange(rawShape[iDim]) * (stride * pixDur_s), iDim))
+                    stride *= rawShape[iDim]
+                if g["lineIdx"] is not None:
+                    # Bidirectional scan, lines of every other image are reversed
+                    nL = rawShape[1]
+                    lineIdx = g["lineIdx"].reshape((nFr, nL)) - np.arange(nFr)[:, np.newaxis] * nL
+                    terms[-1] = (lineIdx * (rawShape[-1] * pixDur_s))[..., np.newaxis]
+            if level == SCMIO_timestampLevel_pixel:
+                x0, x1 = 0, g["dFast"]
+                if crop:
+                    x0, x1 = g["nFastPixOff"], g["dFast"] - g["nFastPixRetr"]
+                terms.append(_axis(np.arange(x0, x1) * pixDur_s, nDim - 1))
+            terms = [self._toDecOrder(t) for t in terms]
+
+        if dense:
+            res = np.zeros(np.broadcast_shapes(*[t.shape for t in terms]))
+            for t in terms:
+                res += t
+            return res
+        return tuple(terms)
+
+    def extractTraces(self, ch, roi_masks, chunk_frames=256, crop=True, background=None):
+        """ Return the mean traces of the ROIs in `roi_masks` for AI channel `ch` as
+            `(nFr, nROIs)` array, or None, if the channel does not exist
+
+            `roi_masks` is an `(nROIs,) + frame shape` array (frames as returned by
+            `getData(ch, crop)`) of boolean masks or of pixel weights (weighted mean).
+            If `background` (a mask of frame shape) is given, the mean trace of these
+            pixels is subtracted from all ROI traces. Traces of empty masks are NaN.
+
+            The ROI means are computed for blocks of `chunk_frames` frames at once, as
+            product with a sparse `(nROIs, nPixels)` matrix (`scipy.sparse`, if available,
+            otherwise a gather with `np.add.reduceat`). If the channel is not loaded, or
+            its frames would have to be gathered from mapped pixel buffers (see `getData`),
+            the frames are streamed from the `.smp` file (see `iterFrames`), hence, memory
+            use is limited to a few blocks and the traces
+        """
+        if not self._prepareFrameAccess(ch):
+            return None
+        shape = self._getDecFrShape(crop)
+        masks = [np.asarray(m) for m in roi_masks]
+        if background is not None:
+            masks.append(np.asarray(background))
+        for m in masks:
+            assert m.shape == shape, f"ABORT: ROI mask shape {m.shape} is not {shape}"
+        apply, isEmpty = self._makeROIMatrix(masks)
+
+        data = None
+        for j, (c, _) in enumerate(self._wPixData):
+            if c == ch and (c in self._wPixGathered or self._isFrDataView(j)):
+                data = self.getData(ch, crop)
+        if data is None:
+            nFr = self._pixGeomDict["nFr"]
+            blocks = self.iterFrames(ch, chunk_frames, crop)
+        else:
+            nFr = len(data)
+            blocks = ((i, data[i:i + chunk_frames]) for i in range(0, nFr, chunk_frames))
+        traces = np.empty((nFr, len(masks)))
+        for t0, block in blocks:
+            traces[t0:t0 + len(block)] = apply(block.reshape((len(block), -1)))
+
+        traces[:, isEmpty] = np.nan
+        if background is not None:
+            traces = traces[:, :-1] - traces[:, -1:]
+        return traces
+
+    @staticmethod
+    def _makeROIMatrix(masks):
+        """ Build the normalized, sparse `(nMasks, nPixels)` weight matrix of `masks` and
+            return `(apply, isEmpty)`, with `apply(block)` the product with a block of
+            `(n, nPixels)` frames as `(n, nMasks)` array
+        """
+        indptr = [0]
+        cols = []
+        vals = []
+        for m in masks:
+            m = m.ravel()
+            idx = np.flatnonzero(m)
+            w = m[idx].astype(np.float64)
+            if len(idx) > 0:
+                w /= w.sum()
+            cols.append(idx)
+            vals.append(w)
+            indptr.append(indptr[-1] + len(idx))
+        cols = np.concatenate(cols)
+        vals = np.concatenate(vals)
+        indptr = np.array(indptr)
+        isEmpty = np.diff(indptr) == 0
+        nPix = masks[0].size
+
+        try:
+            import scipy.sparse
+
+            W = scipy.sparse.csr_matrix((vals, cols, indptr), shape=(len(masks), nPix))
+            return (lambda block: np.asarray((W @ block.T).T)), isEmpty
+        except ImportError:
+            pass
+
+        starts = indptr[:-1][~isEmpty]
+
+        def apply(block):
+            res = np.zeros((len(block), len(masks)))
+            if len(starts) > 0:
+                prod = np.multiply(block[:, cols], vals)
+                res[:, ~isEmpty] = np.add.reduceat(prod, starts, axis=1)
+            return res
+
+        return apply, isEmpty
+
+    def _iterRawTrace(self, ch, chunk):
+        """ Yield `(i0, trace)` tuples with consecutive parts of the raw trace of AI
+            channel `ch` (all pixels in the order they were recorded), of about `chunk`
+            samples, starting with sample `i0`
+        """
+        g = self._pixGeomDict
+        nPixPerFr = int(np.prod(g["frShape"][1:]))
+        isRaw = self._isSMPReady and (
+                self._isMapped or (g["lineIdx"] is None and self._StimBuf.decoder is None)
+        )
+        for c, data in self._wPixData:
+            if c == ch and isRaw:
+                # Loaded pixel data is in recording order (not decoded or re-sorted),
+                # e.g. a view into the mapped pixel buffers
+                rows = data.reshape((-1, data.shape[-1]))
+                nRows = max(1, chunk // rows.shape[1])
+                for i in range(0, len(rows), nRows):
+                    yield i * rows.shape[1], rows[i:i + nRows].ravel()
+                return
+
+        nFr = g["nFr"]
+        nFrPerChunk = max(1, chunk // nPixPerFr)
+        with open(self._fPath + "." + SCMIO_pixelDataFileExtStr, "rb") as f:
+            for iFr in range(0, nFr, nFrPerChunk):
+                n = min(nFrPerChunk, nFr - iFr)
+                yield iFr * nPixPerFr, self._readRawFrameBlock(f, [ch], iFr, n)[0].ravel()
+
+    def _preparePixGeometry(self, quiet=False):
+        """ Determine the layout of the pixel data from the header and store it in
+            `_pixGeomDict`; this is done only once per header, because it also corrects
+            some of the header parameters. Errors are logged, unless `quiet` is True
+            (an invalid pixel size is then returned as error instead of aborting)
+        """
+        if self._pixGeomDict:
+            return ERR_Ok
+        if self._pixGeomErrC is not None:
+            # Failed before, not repeated as the header might already be corrected
+            if not quiet:
+                scm_log(self._pixGeomErrStr)
+            return self._pixGeomErrC
+
+        # Get some scanMode-related parameters
+        nFrPerStep = self.get(SCMIO_keys.USER_NFrPerStep)
+        isAvZStack = self.scanType == ScM_scanType_zStack and nFrPerStep > 1
+        nFrPerStep = nFrPerStep if isAvZStack else 1
+
+        errC = ERR_Ok
+        if self.scanMode in [ScM_scanMode_XYImage, ScM_scanMode_TrajectArb]:
+            dFast = self.dxFr_pix
+            nFastPixRetr = self.dxRetrace_pix
+            nFastPixOff = self.dxOffs_pix
+            dSlow1 = self.dyFr_pix if self.dyFr_pix > 0 else 1
+            dSlow2 = self.dzFr_pix if self.dzFr_pix > 0 else 1
+            if self.scanMode == ScM_scanMode_TrajectArb:
+                # TODO
+                pass
+
+        elif self.scanMode == ScM_scanMode_XZYImage:
+            dFast = self.dxFr_pix
+            nFastPixRetr = self.dxRetrace_pix
+            nFastPixOff = self.dxOffs_pix
+            dSlow1 = self.dzFr_pix if self.dzFr_pix > 0 else 1
+            dSlow2 = self.dyFr_pix if self.dyFr_pix > 0 else 1
+
+        elif self.scanMode == ScM_scanMode_XYZImage:
+            # xy planes stacked along z
+            dFast = self.dxFr_pix
+            nFastPixRetr = self.dxRetrace_pix
+            nFastPixOff = self.dxOffs_pix
+            dSlow1 = self.dyFr_pix if self.dyFr_pix > 0 else 1
+            dSlow2 = self.dzFr_pix if self.dzFr_pix > 0 else 1
+
+        elif self.scanMode == ScM_scanMode_ZXYImage:
+            # z is the fast scanner (ETL), zx sections stacked along y
+            dFast = self.dzFr_pix
+            nFastPixRetr = self.get(SCMIO_keys.USER_nZPixRetrace) or 0
+            nFastPixOff = self.get(SCMIO_keys.USER_nZPixLineOffs) or 0
+            dSlow1 = self.dxFr_pix if self.dxFr_pix > 0 else 1
+            dSlow2 = self.dyFr_pix if self.dyFr_pix > 0 else 1
+        # ***************
+        # ***************
+        else:
+            errC = ERR_UnknownScanMode
+
+        # Check pixel size and pixel buffers
+        pixBLen = self.pixBufLenList[0]
+        if errC == ERR_Ok and pixBLen <= 0:
+            errC = ERR_CannotReshapePixelData
+        if errC != ERR_Ok:
+            s = "ERROR: " + ERRStr[errC]
+            if errC == ERR_NotImplemented:
+                s = s.format(ScM_scanModeStr[self.scanMode])
+            return self._setPixGeometryError(errC, s, quiet)
+        if quiet and self.pixSize_byte not in [2, 8]:
+            return ERR_CannotReshapePixelData
+        assert self.pixSize_byte in [2, 8], "ABORT: Invalid pixel size"
+        _dtype = np.double if self.pixSize_byte == 8 else np.uint16
+
+        # Correct number of pixel buffers, because it is not correctly reported
+        # by the ScanM.dll if one stimulus buffer contained the data for multiple
+        # frames (i.e. cp.stimBufPerFr != 1)
+        if self.nStimBufPerFr > 0:
+            self.nPixBufsSet *= self.nStimBufPerFr
+            self.pixBufCounter *= self.nStimBufPerFr
+
+        # Determine some parameters
+        nPixPerFr = dFast * dSlow1 * dSlow2
+        nBufPerFr = nPixPerFr / pixBLen
+        if self.nPixBufsSet == self.pixBufCounter:
+            nPixB = self.nPixBufsSet * nBufPerFr
+        else:
+            nPixB = (self.nPixBufsSet - self.pixBufCounter) * nBufPerFr
+        nPixB = int(nPixB * nFrPerStep)
+        nAICh = int(self.nInputCh)
+        nImgPerFr = max(1, self.nImgPerFr)
+        self._nFr = int((nPixB / nFrPerStep * pixBLen) / nPixPerFr * nImgPerFr)
+
+        lineIdx = None
+        if nImgPerFr > 1:
+            # Bidirectional scans: A frame contains `nImgPerFr` images along the slow
+            # axis, every other image is scanned backwards (i.e. its lines are in
+            # reverse order)
+            isVolume = self.scanMode in [ScM_scanMode_XYZImage, ScM_scanMode_ZXYImage]
+            if isVolume or dSlow1 % nImgPerFr != 0:
+                errC = ERR_NotImplemented if isVolume else ERR_CannotReshapePixelData
+                s = "ERROR: " + ERRStr[errC]
+                s = s.format(f"{nImgPerFr} images per volume") if isVolume else s
+                return self._setPixGeometryError(errC, s, quiet)
+
+            # Index array that re-sorts the lines of all images
+            nL = dSlow1 // nImgPerFr
+            lineIdx = np.arange(self._nFr * nL).reshape((self._nFr, nL))
+            lineIdx[1::2] = lineIdx[1::2, ::-1]
+            lineIdx = lineIdx.ravel()
+
+            # Correct decoded frame size
+            if self.scanMode in [ScM_scanMode_XYImage, ScM_scanMode_XZYImage]:
+                self.dyFrDec_pix = self.dyFrDec_pix // nImgPerFr
+
+        # Volumes are stored as `(t, dSlow2, dSlow1, dFast)`; `decAxes` transposes
+        # them to `(t, z, y, x)`
+        if self.scanMode in [ScM_scanMode_XYZImage, ScM_scanMode_ZXYImage]:
+            frShape = (self._nFr, dSlow2, dSlow1, dFast)
+        else:
+            frShape = (self._nFr, int(dSlow1 / nImgPerFr), dFast)
+        decAxes = (0, 3, 1, 2) if self.scanMode == ScM_scanMode_ZXYImage else None
+
+        self._pixGeomDict = {
+            "dFast": dFast, "dSlow1": dSlow1, "dSlow2": dSlow2,
+            "nFastPixRetr": nFastPixRetr, "nFastPixOff": nFastPixOff,
+            "pixBLen": pixBLen, "nBufPerFr": int(nBufPerFr), "nPixB": nPixB,
+            "nAICh": nAICh, "nImgPerFr": nImgPerFr, "nFrPerStep": nFrPerStep,
+            "isAvZStack": isAvZStack, "dtype": _dtype,
+            "bufSize_byte": nAICh * pixBLen * self.pixSize_byte,
+            "nFr": self._nFr, "frShape": frShape, "decAxes": decAxes,
+            "lineIdx": lineIdx
+        }
+        return ERR_Ok
+
+    def _setPixGeometryError(self, errC, s, quiet):
+        """ Keep error code and message `s` of `_preparePixGeometry` (and log the
+            latter, unless `quiet` is True)
+        """
+        self._pixGeomErrC = errC
+        self._pixGeomErrStr = s
+        if not quiet:
+            scm_log(s)
+        return errC
+
+    def getFrames(self, ch=0, start=0, stop=None, crop=True):
+        """ Return frames `start` to `stop` (exclusive, slice semantics) of AI channel `ch`
+            as `(n, dSlow1, dFast)` array or None, if the channel does not exist
+
+            Only the pixel buffers that contain the requested frames are read from the `.smp`
+            file; therefore, this also works if `loadSMP` was never called. If `crop` is True,
+            the frames are cropped to the imaging region
+        """
+        if not self._prepareFrameAccess(ch):
+            return None
+        start, stop, _ = slice(start, stop).indices(self._pixGeomDict["nFr"])
+        with open(self._fPath + "." + SCMIO_pixelDataFileExtStr, "rb") as f:
+            return self._readFrames(f, ch, start, max(0, stop - start), crop)
+
+    def iterFrames(self, ch=0, chunk_frames=256, crop=True):
+        """ Generator that reads AI channel `ch` sequentially and yields `(t0, block)`
+            tuples, with `block` an `(n, dSlow1, dFast)` array of (at most) `chunk_frames`
+            frames starting at frame `t0`
+
+            The next block is read in a background thread while the current one is being
+            processed, hence, at most two blocks are held in memory at any time. If `crop`
+            is True, the frames are cropped to the imaging region
+        """
+        if not self._prepareFrameAccess(ch):
+            return
+        nFr = self._pixGeomDict["nFr"]
+        chunk_frames = max(1, int(chunk_frames))
+        with open(self._fPath + "." + SCMIO_pixelDataFileExtStr, "rb") as f, \
+                ThreadPoolExecutor(max_workers=1) as pool:
+            t0 = 0
+            fut = pool.submit(self._readFrames, f, ch, t0, min(chunk_frames, nFr), crop)
+            while t0 < nFr:
+                block = fut.result()
+                t1 = t0 + len(block)
+                if t1 < nFr:
+                    fut = pool.submit(
+                        self._readFrames, f, ch, t1, min(chunk_frames, nFr - t1), crop
+                    )
+                yield t0, block
+                t0 = t1
+
+    def pollFrames(self, ch=0, crop=True):
+        """ Return `(t0, block)` with the frames of AI channel `ch` that were appended to
+            the `.smp` file since the last call (`block` may contain no frames), or None,
+            if the channel does not exist or the `.smp` file is not (yet) there
+
+            For recordings that are still being acquired: the number of complete frames is
+            derived from the file size, only the new pixel buffers are read. Once the
+            post-header with the matching GUID was written, the recording is considered
+            finished (see `isSMPFinal`) and the frame count is taken from the header.
+            If `crop` is True, the frames are cropped to the imaging region
+        """
+        fPathSMP = self._fPath + "." + SCMIO_pixelDataFileExtStr
+        if not os.path.exists(fPathSMP) or not self._prepareFrameAccess(ch):
+            return None
+
+        g = self._pixGeomDict
+        fSize = os.path.getsize(fPathSMP)
+        if not self._isSMPFinal:
+            # Check if post-header is there
+            offs = self._SMHPreHdrDict["analogDataLen_byte"]
+            if offs > 0 and fSize >= offs + SCMIO_preHeaderSize_bytes:
+                d = scm_load_pre_header(fPathSMP, offs)
+                if d["GUID"] == self._SMHPreHdrDict["GUID"]:
+                    self._SMPPreHdrDict = d
+                    self._isSMPFinal = True
+
+        # Determine number of complete frames on disk
+        nPixPerFr = int(np.prod(g["frShape"][1:]))
+        nPixB = fSize // g["bufSize_byte"]
+        nFr = nPixB * g["pixBLen"] // nPixPerFr
+        if self._isSMPFinal:
+            nFr = min(nFr, g["nFr"])
+
+        # Read only the new frames
+        t0 = self._nFrPolledDict.get(ch, 0)
+        with open(fPathSMP, "rb") as f:
+            block = self._readFrames(f, ch, t0, max(0, nFr - t0), crop)
+        self._nFrPolledDict[ch] = t0 + len(block)
+        return t0, block
+
+    def followFrames(self, ch=0, crop=True, interval_s=1.0, timeout_s=None):
+        """ Generator that polls a `.smp` file that is still being written (see
+            `pollFrames`) every `interval_s` seconds and yields `(t0, block)` tuples
+            with the new frames, until the recording is finished or no new frames
+            appeared for `timeout_s` seconds
+        """
+        tLast = time.monotonic()
+        while True:
+            res = self.pollFrames(ch, crop)
+            if res is not None and len(res[1]) > 0:
+                tLast = time.monotonic()
+                yield res
+            if self._isSMPFinal:
+                return
+            if timeout_s is not None and time.monotonic() - tLast > timeout_s:
+                return
+            time.sleep(interval_s)
+
+    @property
+    def readStats(self):
+        # Statistics of the last read of the pixel data (see `BlockReader.stats`)
+        return self._readStats
+
+    @property
+    def isSMPFinal(self):
+        # True, if the post-header of the `.smp` file was found by `pollFrames`
+        return self._isSMPFinal
+
+    def _prepareFrameAccess(self, ch):
+        """ Check if frames of AI channel `ch` can be read directly from the `.smp` file
+        """
+        if not self._isSMHReady:
+            scm_log(f"ERROR: Load `.smh` file first")
+            return False
+        if not self.header.inputChMask & (2 ** ch):
+            return False
+        if self._preparePixGeometry() != ERR_Ok:
+            return False
+
+        g = self._pixGeomDict
+        if self._StimBuf is None:
+            self._StimBuf = StimBuf(self)
+        sb = self._StimBuf
+        if g["isAvZStack"] or (sb.isExtScanFunction and (sb.decoder is None or g["nImgPerFr"] > 1)):
+            s = "Z-stacks" if g["isAvZStack"] else f"Decoder for `{sb.scanFuncName}`"
+            scm_log("ERROR: " + ERRStr[ERR_NotImplemented].format(s))
+            return False
+        return True
+
+    def _readFrames(self, f, ch, start, nFr, crop):
+        """ Read `nFr` frames of AI channel `ch` starting with frame `start` from the open
+            `.smp` file `f`; only the pixel buffers containing these frames are read
+        """
+        return self._readFrameBlock(f, [ch], start, nFr, crop)[0]
+
+    def _readFrameBlock(self, f, chList, start, nFr, crop):
+        """ As `_readFrames`, but for all AI channels in `chList`, which share the (interleaved)
+            pixel buffers; hence, these are read only once. Returns a list of arrays
+        """
+        g = self._pixGeomDict
+        res = []
+        for data in self._readRawFrameBlock(f, chList, start, nFr):
+            if self._StimBuf is not None and self._StimBuf.decoder is not None:
+                # Decoded frames have no retrace and offset to crop
+                res.append(self._decodeBlock(data))
+                continue
+            if g["lineIdx"] is not None:
+                data = self._sortLines(data, start)
+            if crop:
+                data = data[..., g["nFastPixOff"]:g["dFast"] - g["nFastPixRetr"]]
+            res.append(np.ascontiguousarray(self._toDecOrder(data)))
+        return res
+
+    def _readRawFrameBlock(self, f, chList, start, nFr):
+        """ Return the `nFr` frames starting with frame `start` of the AI channels in
+            `chList` from the open `.smp` file `f`, as recorded (i.e. in scan order),
+            as list of `(nFr,) + frShape` views into the pixel buffers read
+        """
+        # Determine the pixel buffers that contain the requested frames
+        g = self._pixGeomDict
+        nPixPerFr = int(np.prod(g["frShape"][1:]))
+        iPix0 = start * nPixPerFr
+        iPixB0 = iPix0 // g["pixBLen"]
+        iPixB1 = -(-(iPix0 + nFr * nPixPerFr) // g["pixBLen"])
+
+        # Read these buffers
+        nByteReq = (iPixB1 - iPixB0) * g["bufSize_byte"]
+        f.seek(iPixB0 * g["bufSize_byte"])
+        buf = f.read(nByteReq)
+        assert len(buf) == nByteReq, "ABORT: End of .smp file, should not happen ..."
+
+        # Extract the channels and the frames
+        pixB = np.frombuffer(buf, dtype=g["dtype"])
+        pixB = pixB.reshape((iPixB1 - iPixB0, g["nAICh"], g["pixBLen"]))
+        m = iPix0 - iPixB0 * g["pixBLen"]
+        geometry = self.header.geometry
+        res = []
+        for ch in chList:
+            iCh = geometry.chIndex(ch)
+            data = pixB[:, iCh, :].ravel()
+            res.append(data[m:m + nFr * nPixPerFr].reshape((nFr,) + g["frShape"][1:]))
+        return res
+
+    def _decodeBlock(self, data, out=None):
+        """ Decode a block of recorded frames `data` (see `_readRawFrameBlock`) with the
+            decoder of the external scan path function, into `out`, if given
+
+            For resorting decoders, the frames are gathered with the pixel permutation
+            (see `StimBuf.pixIdx`) in a single `np.take`
+        """
+        sb = self._StimBuf
+        n = len(data)
+        data = data.reshape((n, -1))
+        if sb.pixIdx is None:
+            res = sb.decoder.decode(data)
+            if out is None:
+                return res
+            out[...] = res
+            return out
+        if out is None:
+            out = np.empty((n,) + sb.pixIdx.shape, sb.decoder.dtype)
+        if out.dtype == data.dtype:
+            np.take(data, sb.pixIdx.ravel(), axis=1, out=out.reshape((n, -1)), mode="clip")
+        else:
+            out.reshape((n, -1))[...] = np.take(data, sb.pixIdx.ravel(), axis=1)
+        return out
+
+    def _unloadPixData(self):
+        """ Release the pixel data but keep header and pixel data geometry, e.g. to
+            pass the object cheaply to another process
+        """
+        self._wPixData = []
+        self._wPixGathered = dict()
+        self._wPixMap = None
+        self._StimBuf = None
+        self._isSMPReady = False
+
+    def _getFrData(self, j, keep=False):
+        """ Return pixel data of the `j`-th loaded channel as `(nFr, dSlow1, dFast)` array
+
+            For memory-mapped data, this is a view into the file as long as the frame layout
+            allows it (i.e. a single AI channel or one pixel buffer per frame); otherwise, the
+            frames are gathered from the interleaved pixel buffers of that channel only. If
+            `keep` is True, gathered frames are kept (read-only) for later calls
+        """
+        ch, data = self._wPixData[j]
+        if ch in self._wPixGathered:
+            return self._wPixGathered[ch]
+        if self._isFrDataView(j):
+            return data.reshape(self._frShape) if data.ndim < 3 else data
+        if self._StimBuf.pixIdx is not None:
+            data = self._gatherPix(j)
+        elif self._pixGeomDict["lineIdx"] is not None:
+            data = self._gatherLines(j, 0, self._dFast)
+        else:
+            data = data.reshape(self._frShape)
+        if keep:
+            data.flags.writeable = False
+            self._wPixGathered[ch] = data
+        return data
+
+    def _isFrDataView(self, j):
+        """ True, if the frames of the `j`-th loaded channel are a view into the loaded
+            or mapped pixel data (see `_getFrData`), i.e. need not be gathered
+        """
+        if not self._isMapped:
+            return True
+        if self._StimBuf.pixIdx is not None or self._pixGeomDict["lineIdx"] is not None:
+            return False
+        data = self._wPixData[j][1]
+        isContiguous = data.strides[0] == data.shape[1] * data.itemsize
+        return isContiguous or self._pixGeomDict["nBufPerFr"] == 1
+
+    def _gatherPix(self, j):
+        """ Return the frames of the mapped `j`-th loaded channel, resorted with the
+            pixel permutation of the decoder (see `StimBuf.pixIdx`), as new array; the
+            pixels are gathered directly from the pixel buffers, in a single pass
+        """
+        g = self._pixGeomDict
+        pixIdx = self._StimBuf.pixIdx
+        nFr, nBufPerFr, pixBLen = g["nFr"], g["nBufPerFr"], g["pixBLen"]
+        data = self._wPixData[j][1][:nFr * nBufPerFr].reshape((nFr, nBufPerFr, pixBLen))
+        return data[:, pixIdx // pixBLen, pixIdx % pixBLen]
+
+    def _gatherLines(self, j, x0, x1, out=None, chunk_frames=256):
+        """ Return pixels `x0` to `x1` of the re-sorted lines (see `_sortLines`) of the
+            mapped `j`-th loaded channel as `(nFr, nLines, x1 - x0)` array, `out` (of any
+            type and memory layout), if given, or a new array
+
+            If the images consist of whole pixel buffers, forward and backward scanned
+            images are copied from `(nFr, nBufPerImg, nLinesPerBuf, dFast)` views into
+            the pixel buffers (the latter with buffers and lines reversed), hence, in a
+            single pass; otherwise, the lines are gathered block by block
+        """
+        g = self._pixGeomDict
+        data = self._wPixData[j][1]
+        nFr, nL, dFast = self._frShape
+        pixBLen = g["pixBLen"]
+        if out is None:
+            out = np.empty((nFr, nL, x1 - x0), data.dtype)
+        if pixBLen % dFast == 0 and (nL * dFast) % pixBLen == 0:
+            shape = (nFr, nL * dFast // pixBLen, pixBLen // dFast)
+            src = data[:nFr * shape[1]].reshape(shape + (dFast,))[..., x0:x1]
+            dst = out.reshape(shape + (x1 - x0,))
+            np.copyto(dst[0::2], src[0::2], casting="unsafe")
+            np.copyto(dst[1::2], src[1::2, ::-1, ::-1], casting="unsafe")
+        else:
+            lineIdx = g["lineIdx"]
+            for i in range(0, nFr, chunk_frames):
+                n = min(chunk_frames, nFr - i)
+                p = lineIdx[i * nL:(i + n) * nL, np.newaxis] * dFast + np.arange(x0, x1)
+                out[i:i + n] = data[p // pixBLen, p % pixBLen].reshape((n, nL, x1 - x0))
+        return out
+
+    def _decodeFrames(self, f, chunk_frames=256):
+        """ Decode the frames of the open `.smp` file `f` into `_wPixData` using the decoder
+            of the external scan path function, in blocks of `chunk_frames` frames
+        """
+        nFr = self._pixGeomDict["nFr"]
+        for iFr in range(0, nFr, chunk_frames):
+            n = min(chunk_frames, nFr - iFr)
+            blocks = self._readRawFrameBlock(f, self._chList, iFr, n)
+            for j, block in enumerate(blocks):
+                self._decodeBlock(block, self._wPixData[j][1][iFr:iFr + n])
+        scm_log(f"{nFr} frame(s) decoded")
+
+    def _averageZStack(self, f, chunk_frames=256):
+        """ Average the `NFrPerStep` frames of each z step of the open `.smp` file `f`
+            into `_wPixData` (and compute the variance, if `_wPixVar` is not empty); the
+            planes are kept as recorded (see `_toDecOrder`)
+
+            Blocks of (at most) `chunk_frames` frames (complete steps) are read and
+            reduced, hence, only one block is held in memory besides the output
+        """
+        g = self._pixGeomDict
+        nStep, nFrPerStep = g["nFr"], g["nFrPerStep"]
+        nStepPerBlock = max(1, chunk_frames // nFrPerStep)
+        avList = [d.reshape(self._frShape) for _, d in self._wPixData]
+        varList = [v for _, v in self._wPixVar]
+        for iStep in range(0, nStep, nStepPerBlock):
+            n = min(nStepPerBlock, nStep - iStep)
+            blocks = self._readRawFrameBlock(f, self._chList, iStep * nFrPerStep, n * nFrPerStep)
+            for j, block in enumerate(blocks):
+                block = block.reshape((n, nFrPerStep) + block.shape[1:])
+                np.mean(block, axis=1, dtype=np.float64, out=avList[j][iStep:iStep + n])
+                if varList:
+                    np.var(block, axis=1, dtype=np.float64, out=varList[j][iStep:iStep + n])
+        scm_log(f"{nStep} z step(s) of {nFrPerStep} frame(s) averaged")
+
+    def getVariance(self, ch=0, crop=False):
+        """ Return the (population) variance across the frames of each z step for the AIn
+            channel `ch` of an averaged z-stack (see `loadSMP`) or None, if it was not kept;
+            `crop` and the order of the dimensions are as for `getData`
+        """
+        for c, var in self._wPixVar:
+            if c == ch:
+                x0, x1 = 0, self._dFast
+                if crop:
+                    x0, x1 = self._nFastPixOff, self._dFast - self._nFastPixRetr
+                return self._toDecOrder(var[..., x0:x1])
         return None
 
+    def _sortLinesInPlace(self, data, chunk_frames=256):
+        """ Re-sort the lines of all images in `data` (see `_sortLines`) block by block,
+            hence, only a block of images is copied at a time
+        """
+        for i in range(0, len(data), chunk_frames):
+            data[i:i + chunk_frames] = self._sortLines(data[i:i + chunk_frames], i)
+
+    def _sortLines(self, data, start=0):
+        """ Re-sort the lines of a bidirectional scan, with `data` a `(n, nLines, dFast)`
+            block of images starting with image `start` (returns a new array)
+        """
+        nL = data.shape[1]
+        lineIdx = self._pixGeomDict["lineIdx"][start * nL:(start + len(data)) * nL]
+        lines = data.reshape((-1, data.shape[2]))
+        return np.take(lines, lineIdx - start * nL, axis=0).reshape(data.shape)
+
+    def _copyFrData(self, j, x0, x1, dtype, order):
+        """ Copy pixels `x0` to `x1` along the fast scan axis of the `j`-th loaded channel
+            into a new array of type `dtype` (see `getData`), whose memory layout is such
+            that the array (order "tyx") or its transpose (order "xyt") is C-contiguous
+
+            Mapped pixel buffers of frames are copied directly (as `(nFr, nBufPerFr,
+            nLinesPerBuf, dFast)` view), hence, without gathering the frames first
+        """
+        g = self._pixGeomDict
+        memOrder = "F" if order == SCMIO_dataOrder_xyt else "C"
+        data = self._wPixData[j][1]
+        if (len(self._frShape) == 3 and data.ndim < 3 and g["lineIdx"] is None and
+                self._StimBuf.decoder is None and g["pixBLen"] % self._dFast == 0):
+            nFr, dSlow1, dFast = self._frShape
+            out = np.empty((nFr, dSlow1, x1 - x0), dtype=dtype, order=memOrder)
+            shape = (nFr, g["nBufPerFr"], g["pixBLen"] // dFast)
+            data = data.reshape(shape + (dFast,))
+            np.copyto(out.reshape(shape + (x1 - x0,)), data[..., x0:x1], casting="unsafe")
+        else:
+            if g["lineIdx"] is not None and data.ndim < 3:
+                # Gather the re-sorted lines directly into the output
+                out = np.empty(self._frShape[:2] + (x1 - x0,), dtype=dtype, order=memOrder)
+                return self._gatherLines(j, x0, x1, out)
+            data = self._toDecOrder(self._getFrData(j)[..., x0:x1])
+            out = np.empty(data.shape, dtype=dtype, order=memOrder)
+            np.copyto(out, data, casting="unsafe")
+        return out
+
+    def _toDecOrder(self, data):
+        """ Return a view of `(t, ..., fast)`-ordered pixel data (as stored in the pixel
+            buffers) in the decoded order, i.e. `(t, y, x)` or `(t, z, y, x)`
+        """
+        decAxes = self._pixGeomDict["decAxes"]
+        if decAxes is None or (self._StimBuf is not None and self._StimBuf.decoder is not None):
+            return data
+        return data.transpose(decAxes)
+
+    def _getDecFrShape(self, crop=False):
+        """ Return the shape of a decoded frame (or volume) without the time axis
+        """
+        if self._StimBuf is not None and self._StimBuf.decoder is not None:
+            return tuple(self._StimBuf.decoder.frShape)
+        g = self._pixGeomDict
+        shape = list(g["frShape"])
+        if crop:
+            shape[-1] -= g["nFastPixOff"] + g["nFastPixRetr"]
+        if g["decAxes"] is not None:
+            shape = [shape[i] for i in g["decAxes"]]
+        return tuple(shape[1:])
+
+    def _mapPixData(self, fPathSMP, nPixB, nAICh, pixBLen, dtype):
+        """ Memory-map the pixel data in `fPathSMP` and populate `_wPixData` with one strided
+            `(nPixB, pixBLen)` view per AI channel into the interleaved
+            `(nPixB, nAICh, pixBLen)` pixel buffers
+        """
+        nByteReq = nPixB * nAICh * pixBLen * np.dtype(dtype).itemsize
+        assert os.path.getsize(fPathSMP) >= nByteReq, \
+            "ABORT: End of .smp file, should not happen ..."
+
+        self._wPixMap = np.memmap(
+            fPathSMP, dtype=dtype, mode="r", shape=(nPixB, nAICh, pixBLen)
+        )
+        geometry = self.header.geometry
+        for iInCh in self._chList:
+            self._wPixData.append([iInCh, self._wPixMap[:, geometry.chIndex(iInCh), :]])
+
     # -------------------------------------------------------------------------------------------
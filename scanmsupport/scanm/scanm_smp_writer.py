@@ -0,0 +1,289 @@
+# ----------------------------------------------------------------------------
+# scanm_smp_writer.py
+# Writer for ScanM files (`.smh` and `.smp`)
+#
+# The MIT License (MIT)
+# (c) Copyright 2022-23 Thomas Euler, Jonathan Oesterle
+#
+# 2026-10-17, first implementation
+# ----------------------------------------------------------------------------
+import os.path
+import uuid
+
+import numpy as np
+
+from .scanm_global import *
+from .scanm_smp import SMP
+from .scanm_stim_buf import StimBuf
+
+# Keys that are condensed/added by `SMH.loadSMH` and need to be expanded again
+# (or are recomputed) when writing a header
+SCMIO_writerSkipKeys = [
+    SCMIO_keys.StimBufLenList.value, SCMIO_keys.TargetedStimDurList.value,
+    SCMIO_keys.RealStimDurList.value, SCMIO_keys.StimBufMapEntries.value,
+    SCMIO_keys.NumberOfInputChans.value, SCMIO_keys.InChan_PixBufLenList.value,
+    SCMIO_keys.NumberOfFrames.value, SCMIO_keys.FrameCounter.value,
+    SCMIO_keys.NumberOfPixBufsSet.value, SCMIO_keys.PixBufCounter.value,
+    SCMIO_keys.InputChannelMask.value, SCMIO_keys.USER_stimBufPerFr.value,
+    SCMIO_keys.HdrLenInValuePairs.value, SCMIO_keys.HdrLenInBytes.value
+]
+
+
+# ----------------------------------------------------------------------------
+class SMPWriter(object):
+    """ Writes a ScanM recording (`.smh` and `.smp` file) in a streaming way
+
+        The header parameters and the pixel data geometry are taken from `smh` (an
+        `SMP` object with a loaded header), `channels` selects the AI channels to
+        write (default: all recorded channels). Pixel data is appended with
+        `writeFrames` (uncropped frames) or `writeBuffers` (interleaved pixel
+        buffers); `close` writes the post-header and the `.smh` file with the final
+        frame count. For z-stacks with more than one frame per step, all frames of
+        each step are written (and `nFr` counts the steps):
+
+            with SMPWriter("cut.smh", smp, channels=[0]) as w:
+                for t0, block in smp.iterFrames(0, crop=False):
+                    w.writeFrames({0: block})
+
+        Recordings with a decoder for their external scan path function can only
+        be copied with `writeBuffers`, decoded frames cannot be written
+    """
+
+    def __init__(self, fPath, smh, channels=None):
+        assert isinstance(smh, SMP), "ABORT: `SMP` object required"
+        assert smh.isSMHReady, "ABORT: Load `.smh` file first"
+        errC = smh._preparePixGeometry()
+        if errC != ERR_Ok:
+            raise ValueError(f"Invalid pixel data geometry (error {errC})")
+        recChList = [i for i in range(SCMIO_maxInputChans) if smh.inputChMask & (2 ** i)]
+        self._chList = recChList if channels is None else sorted(set(channels))
+        for ch in self._chList:
+            assert ch in recChList, "ABORT: " + ERRStr[ERR_ChannelNotRecorded].format(ch)
+
+        g = smh._pixGeomDict
+        self._smh = smh
+        self._pixBLen = g["pixBLen"]
+        self._decAxes = g["decAxes"]
+        self._nImgPerFr = g["nImgPerFr"]
+        self._nFrPerStep = g["nFrPerStep"]
+        self._dtype = g["dtype"]
+        # Pixel buffers per recorded frame (of `nImgPerFr` images, in bidirectional
+        # scans, a buffer may span two images)
+        nPixPerFr = int(np.prod(g["frShape"][1:])) * self._nImgPerFr
+        assert nPixPerFr % self._pixBLen == 0, "ABORT: Frames are not aligned to pixel buffers"
+        self._nBufPerFr = nPixPerFr // self._pixBLen
+
+        # Shape of the (undecoded) frames passed to `writeFrames`, i.e. as recorded,
+        # but with the axes in the order of `getData`
+        frShape = g["frShape"]
+        if self._decAxes is not None:
+            frShape = [frShape[i] for i in self._decAxes]
+        self._frShape = tuple(frShape[1:])
+        if smh._StimBuf is None:
+            smh._StimBuf = StimBuf(smh)
+        self._isDecoded = smh._StimBuf.decoder is not None
+
+        self._fPath = os.path.splitext(fPath)[0]
+        self._GUID = uuid.uuid4().hex
+        self._nPixB = 0
+        self._nImg = 0
+        self._pending = dict()
+        self._f = open(self._fPath + "." + SCMIO_pixelDataFileExtStr, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @property
+    def channels(self):
+        return self._chList
+
+    @property
+    def nFr(self):
+        return self._nPixB // (self._nBufPerFr * self._nFrPerStep) * self._nImgPerFr
+
+    def writeBuffers(self, buf):
+        """ Append interleaved pixel buffers, i.e. an `(n, nChannels, pixBLen)`
+            array (or the respective bytes) for the channels of the writer
+        """
+        if not isinstance(buf, (bytes, bytearray, memoryview)):
+            buf = np.ascontiguousarray(buf, dtype=self._dtype)
+            assert buf.shape[1:] == (len(self._chList), self._pixBLen), "ABORT: Invalid shape"
+        nByte = len(self._chList) * self._pixBLen * np.dtype(self._dtype).itemsize
+        n = memoryview(buf).nbytes
+        assert n % nByte == 0, "ABORT: Incomplete pixel buffers"
+        self._f.write(buf)
+        self._nPixB += n // nByte
+
+    def writeFrames(self, frames):
+        """ Append frames; `frames` maps each channel of the writer to an array
+            of uncropped frames `(n, y, x)` or volumes `(n, z, y, x)`, as returned
+            by `getFrames(crop=False)`
+
+            In bidirectional scans, images are written in whole frames (of
+            `nImgPerFr` images); the images of an incomplete frame are kept until
+            the frame is completed by the next call
+        """
+        assert not self._isDecoded, "ABORT: Decoded frames cannot be written"
+        n = len(frames[self._chList[0]])
+        nPend = len(self._pending.get(self._chList[0], ()))
+        nFrNew = (nPend + n) // self._nImgPerFr
+        buf = np.empty((nFrNew * self._nBufPerFr, len(self._chList), self._pixBLen), self._dtype)
+        for iCh, ch in enumerate(self._chList):
+            fr = frames[ch]
+            assert fr.shape == (n,) + self._frShape, "ABORT: Invalid frame shape"
+            if self._decAxes is not None:
+                # Back to the scan order of the pixel buffers
+                fr = fr.transpose(np.argsort(self._decAxes))
+            if self._nImgPerFr > 1:
+                # Bidirectional scan, reverse lines of every other image
+                i0 = (self._nImg + 1) % 2
+                fr = fr.copy()
+                fr[i0::2] = fr[i0::2, ::-1]
+                if nPend > 0:
+                    fr = np.concatenate([self._pending[ch], fr])
+                self._pending[ch] = fr[nFrNew * self._nImgPerFr:]
+                fr = fr[:nFrNew * self._nImgPerFr]
+            buf[:, iCh, :] = fr.reshape((nFrNew * self._nBufPerFr, self._pixBLen))
+        self._nImg += n
+        self.writeBuffers(buf)
+
+    def close(self):
+        """ Write post-header and `.smh` file
+        """
+        if self._f is None:
+            return
+        assert self._nImg == 0 or self._nImg == self.nFr, "ABORT: Incomplete frame"
+        assert self._nPixB % (self._nBufPerFr * self._nFrPerStep) == 0, \
+            "ABORT: Incomplete z-stack step"
+        nByteData = self._f.tell()
+        hdr, preHdrDict = scm_encode_header(self._getKVPairs(), self._GUID, nByteData)
+        self._f.write(scm_pack_pre_header("SMP", **preHdrDict))
+        self._f.close()
+        self._f = None
+        with open(self._fPath + "." + SCMIO_headerFileExtStr, "wb") as f:
+            f.write(hdr)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _getKVPairs(self):
+        """ Generate the key-value pairs of the new header from the template
+        """
+        smh = self._smh
+        typeStr = {
+            np.character: SCMIO_stringStr, np.uint32: SCMIO_uint32Str,
+            np.uint64: SCMIO_uint64Str, np.float64: SCMIO_real32Str
+        }
+        kvl = []
+        for sKey, (tid, _, v) in smh._kvPairDict.items():
+            if sKey in SCMIO_writerSkipKeys:
+                continue
+            if sKey == SCMIO_keys.USER_dyFrDecoded.value and self._nImgPerFr > 1:
+                # Undo the correction for bidirectional scans (see `_preparePixGeometry`)
+                v = v * self._nImgPerFr
+            if isinstance(v, list):
+                kvl.append((SCMIO_stringStr, sKey, SCMIO_subEntrySep.join(v)))
+            else:
+                kvl.append(_kv_pair(typeStr.get(tid, SCMIO_stringStr), sKey, v))
+
+        # Stimulus buffers
+        stimBufLen = smh.get(SCMIO_keys.StimBufLenList)
+        tarStimDur = smh.get(SCMIO_keys.TargetedStimDurList)
+        realStimDur = smh.get(SCMIO_keys.RealStimDurList)
+        for iBuf in range(smh.nStimBuf):
+            kvl += [
+                _kv_pair(SCMIO_uint32Str, SCMIO_key_StimBufLen_x.format(iBuf),
+                         stimBufLen[iBuf]),
+                _kv_pair(SCMIO_real32Str, SCMIO_key_Ch_x_TargetedStimDur.format(iBuf),
+                         tarStimDur[iBuf]),
+                _kv_pair(SCMIO_real32Str, SCMIO_key_AO_x_Ch_x_RealStimDur.format("A", iBuf),
+                         realStimDur[iBuf])
+            ]
+        mapEntr = smh.get(SCMIO_keys.StimBufMapEntries)
+        for iCh in range(SCMIO_maxStimChans):
+            if smh.stimChMask & (1 << iCh):
+                for iEntr in range(smh.get(SCMIO_keys.MaxStimBufMapLen)):
+                    kvl.append((
+                        SCMIO_uint32Str, SCMIO_key_Ch_x_StimBufMapEntr_y.format(iCh, iEntr),
+                        str(mapEntr[iCh][iEntr])
+                    ))
+
+        # Input channels and pixel buffers
+        mask = sum(2 ** ch for ch in self._chList)
+        kvl.append((SCMIO_uint32Str, SCMIO_keys.InputChannelMask.value, str(mask)))
+        for i in range(len(self._chList)):
+            kvl.append((
+                SCMIO_uint32Str, SCMIO_key_InputCh_x_PixBufLen.format(i), str(self._pixBLen)
+            ))
+
+        # Frame counts (in frames, hence one stimulus buffer per frame)
+        nFr = str(self.nFr // self._nImgPerFr)
+        kvl += [
+            (SCMIO_uint32Str, SCMIO_keys.NumberOfFrames.value, nFr),
+            (SCMIO_uint32Str, SCMIO_keys.FrameCounter.value, nFr),
+            (SCMIO_uint32Str, SCMIO_keys.NumberOfPixBufsSet.value, nFr),
+            (SCMIO_uint32Str, SCMIO_keys.PixBufCounter.value, nFr),
+            (SCMIO_uint32Str, SCMIO_keys.USER_stimBufPerFr.value, "1")
+        ]
+        return kvl
+
+
+# ----------------------------------------------------------------------------
+def _kv_pair(sty, sKey, v):
+    """ Undefined values (None) are written as `NaN`, which `loadSMH` reads
+        back as None
+    """
+    if v is None:
+        return SCMIO_uint32Str, sKey, "NaN"
+    return sty, sKey, str(v)
+
+
+def scm_write_subset(smp, fPath, start=0, stop=None, channels=None,
+                     chunk_byte=64 * 2 ** 20):
+    """ Write frames `start` to `stop` (exclusive) of the AI channels `channels`
+        (default: all) of recording `smp` (an `SMP` object with loaded header) as
+        a new recording `fPath`
+
+        The pixel buffers are copied in blocks of about `chunk_byte` bytes; if all
+        channels are kept, the blocks are copied without decoding. Returns the
+        `SMPWriter` used (closed)
+
+        For z-stacks with more than one frame per step, `start` and `stop` refer to
+        the (averaged) steps and all frames of these steps are copied
+    """
+    with SMPWriter(fPath, smp, channels) as w:
+        g = smp._pixGeomDict
+        start, stop, _ = slice(start, stop).indices(g["nFr"])
+        nImgPerFr = g["nImgPerFr"]
+        if nImgPerFr > 1:
+            # Copy whole frames (pixel buffers may span images) and keep the order
+            # of forward and backward scanned images
+            assert start % np.lcm(2, nImgPerFr) == 0, \
+                "ABORT: Subset must start with a forward scanned frame"
+            assert stop <= start or stop % nImgPerFr == 0, \
+                f"ABORT: Subset must end with a complete frame ({nImgPerFr} images)"
+        nBufPerStep = w._nBufPerFr * g["nFrPerStep"]
+        iPixB0 = start // nImgPerFr * nBufPerStep
+        iPixB1 = max(start, stop) // nImgPerFr * nBufPerStep
+        nAICh = g["nAICh"]
+        recChList = [i for i in range(SCMIO_maxInputChans) if smp.inputChMask & (2 ** i)]
+        iChList = [recChList.index(ch) for ch in w.channels]
+        isAllCh = iChList == list(range(nAICh))
+        nBufPerChunk = max(1, chunk_byte // g["bufSize_byte"])
+
+        with open(smp.filePath + "." + SCMIO_pixelDataFileExtStr, "rb") as f:
+            f.seek(iPixB0 * g["bufSize_byte"])
+            for i in range(iPixB0, iPixB1, nBufPerChunk):
+                n = min(nBufPerChunk, iPixB1 - i)
+                buf = f.read(n * g["bufSize_byte"])
+                assert len(buf) == n * g["bufSize_byte"], \
+                    "ABORT: End of .smp file, should not happen ..."
+                if not isAllCh:
+                    data = np.frombuffer(buf, dtype=g["dtype"])
+                    buf = data.reshape((n, nAICh, g["pixBLen"]))[:, iChList, :]
+                w.writeBuffers(buf)
+    return w
+
+# ----------------------------------------------------------------------------
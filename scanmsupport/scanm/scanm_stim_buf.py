@@ -7,8 +7,16 @@
 #
 # 2022-01-31, first implementation
 # 2023-06-16, changes to cope with older files
+# 2026-10-17, decoders for external scan path functions
+# 2026-10-17, process-wide cache of prepared stimulus buffers
 # ----------------------------------------------------------------------------
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
 from .scanm_global import *
+from .scanm_decoder import scm_get_decoder
 
 
 # ----------------------------------------------------------------------------
@@ -26,6 +34,8 @@ class StimBuf(object):
         """ Resets object
         """
         self._isReady = False
+        self.decoder = None
+        self.pixIdx = None
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     def _populate(self):
@@ -43,6 +53,21 @@ class StimBuf(object):
         '''
         self.pixDecodeMode = ScM_PixDataResorted  # vs. ScM_PixDataDecoded
 
+        if self.isExtScanFunction:
+            # Prepare the decoder registered for the external scan path function,
+            # unless a recording with the same scan path was prepared before
+            decoderClass = scm_get_decoder(sUserScanFName)
+            if decoderClass is not None:
+                key = self._getCacheKey(decoderClass)
+                entry = SCMIO_stimBufCache.get(key)
+                if entry is None:
+                    entry = self._prepareDecoder(decoderClass)
+                    SCMIO_stimBufCache.put(key, entry)
+                else:
+                    scm_log(f"Decoder for `{sUserScanFName}` taken from cache")
+                self.decoder, self.pixDecodeMode, self.pixIdx = entry
+        self._isReady = True
+
         '''
         printf "### Looking for stimulus buffer for `%s` ...\r", sUserScanFFull
     
@@ -168,4 +193,126 @@ class StimBuf(object):
         return pwInfo
         '''
 
-    # ----------------------------------------------------------------------------
+    def _prepareDecoder(self, decoderClass):
+        """ Instantiate and prepare the decoder, returns `(decoder, pixDecodeMode, pixIdx)`
+
+            For decoders that only resort the pixels, `pixIdx` is the permutation as
+            index array (of shape `frShape`) into the pixels of a recorded frame; it is
+            taken from the decoder (if it sets `pixIdx`) or obtained by decoding a frame
+            of pixel indices, otherwise it is None
+        """
+        sUserScanFFull = self._smh.get(SCMIO_keys.USER_scanPathFunc)
+        params = [_to_number(v) for v in sUserScanFFull[1:]]
+        decoder = decoderClass()
+        pixDecodeMode = decoder.prepare(self, params)
+        if decoder.dtype is None:
+            decoder.dtype = (
+                np.float64 if pixDecodeMode == ScM_PixDataDecoded else
+                (np.double if self._smh.pixSize_byte == 8 else np.uint16)
+            )
+        pixIdx = None
+        if pixDecodeMode == ScM_PixDataResorted:
+            pixIdx = decoder.pixIdx
+            if pixIdx is None and self._smh._preparePixGeometry() == ERR_Ok:
+                g = self._smh._pixGeomDict
+                nPixPerFr = g["pixBLen"] * g["nBufPerFr"]
+                idx = decoder.decode(np.arange(nPixPerFr, dtype=np.int64)[np.newaxis])
+                if idx.dtype == np.int64 and idx.shape[1:] == tuple(decoder.frShape):
+                    pixIdx = idx[0]
+            if pixIdx is not None:
+                pixIdx = np.ascontiguousarray(pixIdx, dtype=np.intp)
+                pixIdx.flags.writeable = False
+        scm_log(f"Decoder for `{sUserScanFFull[0]}` prepared")
+        return decoder, pixDecodeMode, pixIdx
+
+    def _getCacheKey(self, decoderClass):
+        """ Key of the prepared decoder: the full `ScanPathFunc` string and the header
+            parameters the scan path depends on
+        """
+        smh = self._smh
+        return (
+            decoderClass, tuple(smh.get(SCMIO_keys.USER_scanPathFunc)),
+            smh.scanMode, smh.pixSize_byte, smh.nPixBufPerFr, smh.nImgPerFr,
+            smh.dxFr_pix, smh.dyFr_pix, smh.dzFr_pix,
+            smh.dxFrDec_pix, smh.dyFrDec_pix, smh.dzFrDec_pix,
+            tuple(int(n) for n in smh.pixBufLenList)
+        )
+
+    @property
+    def smh(self):
+        return self._smh
+
+    @property
+    def scanFuncName(self):
+        return self._smh.get(SCMIO_keys.USER_scanPathFunc)[0]
+
+
+# ----------------------------------------------------------------------------
+class StimBufCache(object):
+    """ Process-wide, thread-safe cache of prepared scan path decoders (with their
+        count matrices, index maps etc.), keyed by the full `ScanPathFunc` string
+        plus the relevant header parameters (see `StimBuf._getCacheKey`)
+
+        Like the stimulus buffer list of the Igor code, it lets recordings with the
+        same scan path share one prepared decoder; hence, `decode` must not change
+        the state of a decoder. At most `maxEntries` entries are kept, the least
+        recently used are evicted.
+    """
+
+    def __init__(self, maxEntries=32):
+        self._maxEntries = maxEntries
+        self._dict = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"nHits": 0, "nMisses": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._dict.get(key)
+            if entry is None:
+                self._stats["nMisses"] += 1
+            else:
+                self._stats["nHits"] += 1
+                self._dict.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._dict[key] = entry
+            self._dict.move_to_end(key)
+            while len(self._dict) > self._maxEntries:
+                self._dict.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._dict.clear()
+            self._stats = {"nHits": 0, "nMisses": 0}
+
+    @property
+    def maxEntries(self):
+        return self._maxEntries
+
+    @maxEntries.setter
+    def maxEntries(self, n):
+        with self._lock:
+            self._maxEntries = n
+            while len(self._dict) > n:
+                self._dict.popitem(last=False)
+
+    @property
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, nEntries=len(self._dict))
+
+
+SCMIO_stimBufCache = StimBufCache()
+
+
+def _to_number(s):
+    for t in (int, float):
+        try:
+            return t(s)
+        except ValueError:
+            pass
+    return s
+
+# ----------------------------------------------------------------------------
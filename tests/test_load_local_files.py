@@ -1,6 +1,7 @@
 import numpy as np
 import pytest
 
+from scanmsupport.scanm.scanm_smp import SMP
 from utils import try_load_file, load_h5_file
 
 import os
@@ -57,3 +58,97 @@ def test_data_xz_file_compared_to_h5():
     assert np.allclose(wDataCh0, h5_data['wDataCh0'])
     assert np.allclose(wDataCh1, h5_data['wDataCh1'])
     assert np.allclose(wDataCh2, h5_data['wDataCh2'])
+
+
+@pytest.mark.skipif(not os.path.isfile(__filepath_xy), reason="File not found")
+def test_data_xy_file_mmap_compared_to_read():
+    scmf = try_load_file(__filepath_xy)
+    scmf_mmap = try_load_file(__filepath_xy, mode="mmap")
+
+    for ch in range(3):
+        assert np.array_equal(scmf.getData(ch), scmf_mmap.getData(ch))
+        assert np.array_equal(scmf.getData(ch, crop=True), scmf_mmap.getData(ch, crop=True))
+
+
+@pytest.mark.skipif(not os.path.isfile(__filepath_xy), reason="File not found")
+def test_data_xy_file_channel_subset():
+    scmf = try_load_file(__filepath_xy)
+    scmf_sub = try_load_file(__filepath_xy, channels=[0, 2])
+
+    assert scmf_sub.channels == [0, 2]
+    assert scmf_sub.getData(1) is None
+    assert np.array_equal(scmf.getData(0), scmf_sub.getData(0))
+    assert np.array_equal(scmf.getData(2), scmf_sub.getData(2))
+
+
+@pytest.mark.skipif(not os.path.isfile(__filepath_xy), reason="File not found")
+def test_data_xy_file_get_frames():
+    scmf = try_load_file(__filepath_xy)
+    scmf_hdr = SMP()
+    scmf_hdr.loadSMH(__filepath_xy)
+
+    for ch in range(3):
+        for start, stop in [(0, 50), (3, 7), (-5, None)]:
+            frames = scmf_hdr.getFrames(ch, start, stop, crop=True)
+            assert np.array_equal(frames, scmf.getData(ch, crop=True)[start:stop])
+
+
+@pytest.mark.skipif(not os.path.isfile(__filepath_xy), reason="File not found")
+def test_data_xy_file_iter_frames():
+    scmf = try_load_file(__filepath_xy)
+
+    blocks = list(scmf.iterFrames(0, chunk_frames=100, crop=True))
+    assert [t0 for t0, _ in blocks] == list(range(0, scmf.nFr, 100))
+    assert np.array_equal(np.concatenate([b for _, b in blocks]), scmf.getData(0, crop=True))
+
+
+@pytest.mark.skipif(not os.path.isfile(__filepath_xy.replace(".smp", ".smh")), reason="File not found")
+def test_header_index(tmp_path):
+    from scanmsupport.index import SMHIndex
+    fPathSMH = os.path.abspath(__filepath_xy.replace(".smp", ".smh"))
+
+    with SMHIndex(str(tmp_path / "index.sqlite")) as idx:
+        res = idx.update(os.path.dirname(fPathSMH), workers=1)
+        assert res["nParsed"] == 1 and res["nFailed"] == 0
+        assert idx.update(os.path.dirname(fPathSMH), workers=1)["nParsed"] == 0
+
+        assert idx.find(ScanMode=0, NumberOfInputChans=3, DateStamp=("like", "2021-%")) == [fPathSMH]
+        assert idx.find(Zoom=(">=", 2)) == []
+        d = idx.get(fPathSMH)
+        assert d["GUID"] == "5cf3d701b023c2132923be84e16cd6ae"
+        assert d["ScanPathFunc"][0] == "XYScan2"
+
+
+@pytest.mark.skipif(not os.path.isfile(__filepath_xy.replace(".smp", ".smh")), reason="File not found")
+def test_load_xy_header():
+    from scanmsupport.scanm.scanm_smh import SMH
+    smh = SMH()
+    assert smh.loadSMH(__filepath_xy) == 0
+
+    assert smh.get("ComputerName") == "euler14_01"
+    assert smh.get("ScanPathFunc") == ["XYScan2", "5120", "80", "64", "10", "6", "0", "1"]
+    assert smh.pixDur_us == 25.0
+    assert smh.get("ZLensShifty") is None
+    assert smh.get("Header_length_in_bytes") == 5362
+    assert list(smh.pixBufLenList) == [2560, 2560, 2560]
+
+
+@pytest.mark.skipif(not os.path.isfile(__filepath_xy.replace(".smp", ".smh")), reason="File not found")
+def test_load_xy_header_cached(tmp_path):
+    from scanmsupport.scanm.scanm_smh import SMH
+    from scanmsupport.scanm.scanm_hdr_cache import SMHCache
+    smh = SMH()
+    smh.loadSMH(__filepath_xy)
+
+    cache = SMHCache(str(tmp_path), maxEntries=4)
+    for _ in range(2):
+        smh_cached = SMH()
+        assert smh_cached.loadSMH(__filepath_xy, cache=cache) == 0
+        assert smh_cached.GUID == smh.GUID
+        assert smh_cached.get("ScanPathFunc") == smh.get("ScanPathFunc")
+    assert cache.stats["nHits"] == 1 and cache.stats["nMisses"] == 1
+
+    # A new cache object finds the entry on disk
+    cache = SMHCache(str(tmp_path))
+    SMH().loadSMH(__filepath_xy, cache=cache)
+    assert cache.stats["nHits"] == 1
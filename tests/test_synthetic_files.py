@@ -0,0 +1,855 @@
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from scanmsupport.batch import load_many
+from scanmsupport.export import export_data
+from scanmsupport.index import SMHIndex
+from scanmsupport.scanm.helpers import gen_scmf_files
+from scanmsupport.scanm.scanm_decoder import (
+    ScanDecoder, scm_register_decoder, scm_unregister_decoder
+)
+from scanmsupport.scanm.scanm_global import (
+    ERR_ChannelNotRecorded, ERR_NotImplemented, ERR_Ok, ScM_PixDataDecoded, scm_set_stats_hook
+)
+from scanmsupport.scanm.scanm_hdr_cache import SMHCache
+from scanmsupport.scanm.scanm_hdr_record import scm_hdr_records_to_array
+from scanmsupport.scanm.scanm_smh import SMH
+from scanmsupport.scanm.scanm_smp import SMP
+from scanmsupport.scanm.scanm_stim_buf import SCMIO_stimBufCache
+from scanmsupport.scanm.scanm_smp_writer import SMPWriter, scm_write_subset
+from utils import try_load_file
+
+
+def gen_data(nFr, dSlow, dFast, chList, pixSize_byte=2, seed=0):
+    rng = np.random.default_rng(seed)
+    if pixSize_byte == 2:
+        return {ch: rng.integers(0, 2 ** 16, (nFr, dSlow, dFast), dtype=np.uint16) for ch in chList}
+    return {ch: rng.standard_normal((nFr, dSlow, dFast)) for ch in chList}
+
+
+def _run_optimized(script, *args):
+    # Run `script` in a new interpreter with assertions disabled
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.run(
+        [sys.executable, "-O", "-c", script, *args], cwd=root, capture_output=True, text=True
+    )
+
+
+@pytest.mark.parametrize("pixSize_byte", [2, 8])
+@pytest.mark.parametrize("mode", ["read", "mmap"])
+def test_load_synthetic_xy_file(tmp_path, pixSize_byte, mode):
+    data = gen_data(25, 16, 40, [0, 2], pixSize_byte)
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=25, inputChMask=0b101,
+        pixSize_byte=pixSize_byte, dxRetrace=4, dxOffs=2, data=data, chunk_frames=7
+    )
+    scmf = try_load_file(fPath, mode=mode)
+
+    assert scmf.nFr == 25
+    assert scmf.channels == [0, 2]
+    for ch in [0, 2]:
+        assert np.array_equal(scmf.getData(ch), data[ch])
+        assert np.array_equal(scmf.getData(ch, crop=True), data[ch][:, :, 2:-4])
+
+
+@pytest.mark.parametrize("inputChMask", [0b001, 0b101])
+@pytest.mark.parametrize("nBufPerFr", [1, 4])
+def test_load_synthetic_mmap(tmp_path, inputChMask, nBufPerFr):
+    chList = [ch for ch in range(3) if inputChMask & (1 << ch)]
+    data = gen_data(20, 16, 40, chList)
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=20, inputChMask=inputChMask,
+        nBufPerFr=nBufPerFr, dxRetrace=4, dxOffs=2, data=data
+    )
+    scmf = try_load_file(fPath, mode="mmap")
+    scmf_read = try_load_file(fPath)
+
+    # A view into the file, unless the frames are spread over interleaved buffers
+    isView = len(chList) == 1 or nBufPerFr == 1
+    for ch in chList:
+        d = scmf.getData(ch, crop=True)
+        assert np.array_equal(d, data[ch][..., 2:-4])
+        assert np.array_equal(d, scmf_read.getData(ch, crop=True))
+        assert np.shares_memory(d, scmf._wPixMap) == isView
+        assert not d.flags.writeable
+
+
+@pytest.mark.parametrize("mode", ["read", "mmap"])
+def test_load_synthetic_channel_subset(tmp_path, mode):
+    data = gen_data(10, 16, 40, [0, 1, 2])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=10, nBufPerFr=4, data=data
+    )
+    scmf = try_load_file(fPath, mode=mode, channels=[2, 0, 2])
+
+    assert scmf.channels == [0, 2]
+    assert scmf.getData(1) is None
+    for ch in [0, 2]:
+        assert np.array_equal(scmf.getData(ch), data[ch])
+
+    scmf = SMP()
+    scmf.loadSMH(fPath)
+    assert scmf.loadSMP(mode=mode, channels=[0, 3]) == ERR_ChannelNotRecorded
+
+
+@pytest.mark.parametrize("mode", ["mmap", "read"])
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("nBufPerFr", [1, 4])
+def test_load_many_synthetic(tmp_path, mode, workers, nBufPerFr):
+    datas = []
+    for i in range(3):
+        datas.append(gen_data(10, 16, 40, [0, 1, 2], seed=i))
+        gen_scmf_files(
+            str(tmp_path / f"rec{i}.smh"), dxFr=40, dyFr=16, nFr=10, nBufPerFr=nBufPerFr,
+            dxRetrace=4, dxOffs=2, data=datas[-1], seed=i
+        )
+    # Pixel data file that ends early
+    gen_scmf_files(str(tmp_path / "cut.smh"), dxFr=40, dyFr=16, nFr=10, seed=3)
+    buf = (tmp_path / "cut.smp").read_bytes()
+    (tmp_path / "cut.smp").write_bytes(buf[:len(buf) // 2])
+
+    fNames = ["rec0.smh", "missing.smh", "rec1.smh", "cut.smh", "rec2.smh"]
+    paths = [str(tmp_path / f) for f in fNames]
+    results = load_many(paths, workers=workers, channels=[0, 2], crop=True, mode=mode)
+    assert [res.ok for res in results] == [True, False, True, False, True]
+    assert results.stats["nFiles"] == 5 and results.stats["nFailed"] == 2
+    assert results[3].error != "" and results[3].data == dict()
+    assert results[3].smp is None
+    for res, data in zip(results[::2], datas):
+        if mode == "mmap":
+            # Lazy handles, channels that would have to be gathered are not in `data`
+            assert res.smp.channels == [0, 2]
+            assert sorted(res.data) == ([0, 2] if nBufPerFr == 1 else [])
+            assert not res.smp._wPixGathered
+            for ch in [0, 2]:
+                assert np.array_equal(res.smp.getData(ch, crop=True), data[ch][..., 2:-4])
+        else:
+            assert sorted(res.data) == [0, 2] and res.smp.channels == []
+        for ch in res.data:
+            assert np.array_equal(res.data[ch], data[ch][..., 2:-4])
+
+
+@pytest.mark.parametrize("block_byte", [1, 5000, 2 ** 30])
+def test_load_synthetic_blocks(tmp_path, block_byte):
+    data = gen_data(25, 16, 40, [0, 1, 2])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=25, data=data
+    )
+    scmf = try_load_file(fPath, channels=[0, 2], block_byte=block_byte)
+
+    # Blocks are multiples of the (interleaved) pixel buffers
+    nBlocks = {1: 50, 5000: 25, 2 ** 30: 1}[block_byte]
+    assert scmf.readStats["nBlocks"] == nBlocks
+    assert scmf.readStats["nBytes"] == 50 * 3 * 320 * 2
+    for ch in [0, 2]:
+        assert np.array_equal(scmf.getData(ch), data[ch])
+
+
+def test_load_stats(tmp_path, capsys, caplog):
+    fPath = gen_scmf_files(str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=10)
+    reported = []
+    scm_set_stats_hook(lambda fPath, stage, d: reported.append(stage))
+    try:
+        with caplog.at_level("INFO", logger="scanmsupport"):
+            scmf = try_load_file(fPath)
+    finally:
+        scm_set_stats_hook(None)
+
+    # Quiet by default, messages go to the logger
+    assert capsys.readouterr().out == ""
+    assert any("Done." in r.message for r in caplog.records)
+    stages = ["preHeader", "kvRead", "kvParse", "postHeader", "pixRead", "reshape"]
+    assert reported == stages
+    stats = scmf.stats
+    assert list(stats) == stages
+    assert stats["pixRead"]["nBytes"] == 10 * 2 * 3 * 320 * 2
+    assert all(s["time_s"] >= 0 and s["MB_per_s"] >= 0 for s in stats.values())
+
+
+def test_header_records(tmp_path):
+    recs = []
+    for i, (dyFr, nFr, mask) in enumerate([(16, 10, 0b111), (32, 5, 0b101), (16, 20, 0b001)]):
+        fPath = gen_scmf_files(
+            str(tmp_path / f"rec{i}.smh"), dxFr=40, dyFr=dyFr, nFr=nFr, inputChMask=mask
+        )
+        scmf = SMP()
+        scmf.loadSMH(fPath)
+        recs.append(scmf.header)
+
+    hdr = recs[1]
+    assert (hdr.dyFr_pix, hdr.inputChMask, hdr.pixSize_byte) == (32, 0b101, 2)
+    assert hdr.geometry.nFr == 5 and hdr.geometry.chList == (0, 2)
+    assert hdr.geometry.chIndex(2) == 1
+    with pytest.raises(AttributeError):
+        hdr.dxFr_pix = 10
+
+    # Header only, hence, no pixel data geometry
+    smh = SMH()
+    smh.loadSMH(str(tmp_path / "rec0.smh"))
+    assert smh.header.geometry is None and smh.header.dxFr_pix == 40
+
+    a = scm_hdr_records_to_array(recs + [smh.header])
+    assert list(a["fPath"][(a["dyFr_pix"] == 16) & (a["g_nFr"] > 10)]) == [recs[2].fPath]
+    assert list(a["g_nFr"]) == [10, 5, 20, -1]
+
+
+@pytest.mark.parametrize("kv", [
+    ("ScanMode=0;", "ScanMode=1;"), ("PixelSizeInBytes=2;", "PixelSizeInBytes=4;")
+])
+def test_header_without_geometry(tmp_path, caplog, kv):
+    # Line scan or invalid pixel size, the header is fine, the pixel data is not
+    fPath = gen_scmf_files(str(tmp_path / "rec.smh"), dxFr=40, dyFr=16, nFr=5)
+    old, new = kv
+    buf = (tmp_path / "rec.smh").read_bytes()
+    assert old.encode("utf-16-le") in buf
+    buf = buf.replace(old.encode("utf-16-le"), new.encode("utf-16-le"))
+    (tmp_path / "rec.smh").write_bytes(buf)
+
+    scmf = SMP()
+    assert scmf.loadSMH(fPath) == ERR_Ok
+    assert scmf._pixGeomErrC is None and not scmf._pixGeomDict
+    assert scmf.header.geometry is None and scmf.header.dxFr_pix == 40
+    assert not any(r.levelname == "ERROR" for r in caplog.records)
+    if kv[0].startswith("ScanMode"):
+        assert scmf.loadSMP() == ERR_NotImplemented
+    else:
+        with pytest.raises(AssertionError, match="pixel size"):
+            scmf.loadSMP()
+
+
+def test_header_cached_bidirectional(tmp_path):
+    data = gen_data(8, 24, 40, [0, 1])
+    fPath = gen_scmf_files(
+        str(tmp_path / "bi.smh"), dxFr=40, dyFr=24, nFr=8, inputChMask=0b011,
+        nBufPerFr=4, nImgPerFr=2, data=data
+    )
+    cache = SMHCache(str(tmp_path / "cache"))
+    hdrs = []
+    for _ in range(2):
+        # Cold, then warm load; header corrections must only be applied once
+        scmf = SMP()
+        assert scmf.loadSMH(fPath, cache=cache) == 0
+        assert scmf.loadSMP() == 0
+        assert scmf.dyFrDec_pix == 12 and scmf.nFr == 16
+        assert np.array_equal(scmf.getData(1)[1], data[1][0, 12:][::-1])
+        hdrs.append(scmf.header)
+    assert cache.stats["nHits"] == 1 and cache.stats["nMisses"] == 1
+    assert hdrs[0] == hdrs[1]
+
+
+def test_header_index(tmp_path):
+    # Sibling directories whose names differ only where `LIKE` has a wildcard
+    fPaths = []
+    for dName in ["exp_1", "expA1", "exp%1"]:
+        (tmp_path / dName).mkdir()
+        fPaths.append(gen_scmf_files(
+            str(tmp_path / dName / "rec.smh"), dxFr=40, dyFr=16, nFr=4, seed=len(fPaths)
+        ))
+
+    with SMHIndex(str(tmp_path / "index.sqlite")) as idx:
+        res = idx.update(str(tmp_path), workers=1)
+        assert res["nParsed"] == 3 and res["nFailed"] == 0
+        for dName in ["exp_1", "exp%1"]:
+            res = idx.update(str(tmp_path / dName), workers=1)
+            assert res == {"nFiles": 1, "nParsed": 0, "nRemoved": 0, "nFailed": 0}
+        assert idx.nFiles == 3
+
+        (tmp_path / "expA1" / "rec.smh").unlink()
+        assert idx.update(str(tmp_path / "exp_1"), workers=1)["nRemoved"] == 0
+        assert idx.update(str(tmp_path), workers=1)["nRemoved"] == 1
+        assert idx.find(FrameWidth=40, DateStamp=("like", "2023-%")) == sorted(
+            [fPaths[0], fPaths[2]]
+        )
+
+
+@pytest.mark.parametrize("mode", [None, "read", "mmap"])
+def test_get_triggers(tmp_path, mode):
+    data = gen_data(20, 16, 40, [0, 2])
+    trace = np.full(20 * 16 * 40, 1000, dtype=np.uint16)
+    on = np.array([5, 3000, 3005, 3100, 640 * 7 - 1, 12790])
+    for i in on:
+        trace[i:i + 30] = 40000
+    trace[0:3] = 40000
+    data[2] = trace.reshape((20, 16, 40))
+    fPath = gen_scmf_files(
+        str(tmp_path / "trig.smh"), dxFr=40, dyFr=16, nFr=20, inputChMask=0b101,
+        data=data, pixDur_us=4.0
+    )
+    scmf = SMP()
+    scmf.loadSMH(fPath)
+    if mode is not None:
+        scmf.loadSMP(mode=mode)
+
+    pixIdx, frIdx, t_s = scmf.getTriggers(chunk_byte=1000)
+    assert list(pixIdx) == [5, 3000, 3100, 640 * 7 - 1, 12790]
+    assert list(frIdx) == [0, 4, 4, 6, 19]
+    assert np.allclose(t_s, pixIdx * 4E-6)
+
+    # Triggers close to the previous one are ignored
+    pixIdx, _, _ = scmf.getTriggers(2, threshold=20000, min_gap=200)
+    assert list(pixIdx) == [5, 3000, 640 * 7 - 1, 12790]
+    assert scmf.getTriggers(1) is None
+
+
+@pytest.mark.parametrize("kind", ["xy", "bidirectional", "xyz", "zxy", "decoded"])
+def test_get_timestamps(tmp_path, kind):
+    # Pixel values are the indices of the pixels in the recording, hence, the
+    # timestamps must be the values times the pixel duration
+    kwargs, rawShape = {
+        "xy": (dict(), (6, 16, 40)),
+        "bidirectional": (dict(dyFr=32, nImgPerFr=2, nBufPerFr=4), (6, 32, 40)),
+        "xyz": (dict(dzFr=4, scanMode=3, nBufPerFr=8), (6, 4, 16, 40)),
+        "zxy": (dict(dxFr=8, dzFr=40, scanMode=5, nBufPerFr=8), (6, 16, 8, 40)),
+        "decoded": (dict(scanPathFunc="TestTs"), (6, 16, 40))
+    }[kind]
+    data = np.arange(np.prod(rawShape), dtype=np.float64).reshape(rawShape)
+    fPath = gen_scmf_files(
+        str(tmp_path / "ts.smh"), **dict(dict(dxFr=40, dyFr=16), **kwargs), nFr=6,
+        inputChMask=0b001, pixSize_byte=8, dxRetrace=4, dxOffs=2, pixDur_us=2.5,
+        data={0: data}
+    )
+    scm_register_decoder("TestTs", _SnakeDecoder)
+    try:
+        scmf = try_load_file(fPath)
+        for crop in [False, True]:
+            ts = scmf.getData(0, crop=crop) * 2.5E-6
+            terms = scmf.getTimestamps(crop=crop)
+            assert max(t.size for t in terms) < ts.size
+            assert np.allclose(sum(terms), ts)
+            assert np.allclose(scmf.getTimestamps(crop=crop, dense=True), ts)
+            if kind != "decoded":
+                # Line starts (fast axis is the last one, or the z axis for ZXY)
+                lines = scmf.getTimestamps("line", crop=crop, dense=True)
+                x0 = 2 if crop else 0
+                tStart = np.take(ts, [0], axis=1 if kind == "zxy" else -1) - x0 * 2.5E-6
+                assert np.allclose(lines, tStart)
+        frames = scmf.getTimestamps("frame")[0].ravel()
+        assert np.allclose(frames, scmf.getData(0).reshape((len(ts), -1)).min(axis=1) * 2.5E-6)
+    finally:
+        scm_unregister_decoder("TestTs")
+
+
+@pytest.mark.parametrize("mode", [None, "read", "mmap"])
+def test_extract_traces(tmp_path, mode):
+    data = gen_data(30, 16, 40, [0, 1])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=30, inputChMask=0b011,
+        dxRetrace=4, dxOffs=2, data=data
+    )
+    scmf = SMP()
+    scmf.loadSMH(fPath)
+    if mode is not None:
+        scmf.loadSMP(mode=mode)
+
+    rng = np.random.default_rng(2)
+    masks = np.zeros((4, 16, 34), dtype=bool)
+    masks[0, 2:5, 3:8] = True
+    masks[1, 10, 20:30] = True
+    masks[3] = rng.random((16, 34)) < 0.1
+    weights = np.where(masks, rng.random(masks.shape), 0.)
+    bg = np.zeros((16, 34), dtype=bool)
+    bg[-3:] = True
+
+    frames = data[1][..., 2:-4].astype(np.float64)
+    ref = np.stack([frames[:, m].mean(axis=1) for m in masks[[0, 1, 3]]], axis=1)
+    traces = scmf.extractTraces(1, masks, chunk_frames=7)
+    assert traces.shape == (30, 4)
+    assert np.allclose(traces[:, [0, 1, 3]], ref)
+    assert np.all(np.isnan(traces[:, 2]))
+
+    refW = np.stack([(frames * w).sum(axis=(1, 2)) / w.sum() for w in weights[[0, 1, 3]]], axis=1)
+    traces = scmf.extractTraces(1, weights, background=bg)
+    assert np.allclose(traces[:, [0, 1, 3]], refW - frames[:, bg].mean(axis=1)[:, np.newaxis])
+    assert scmf.extractTraces(2, masks) is None
+
+
+def test_extract_traces_mapped_memory(tmp_path):
+    # Frames of a mapped channel are not contiguous (3 AI channels, 4 buffers per frame)
+    data = gen_data(800, 64, 80, [1])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=80, dyFr=64, nFr=800, nBufPerFr=4, data=data
+    )
+    scmf = try_load_file(fPath, mode="mmap")
+    masks = np.zeros((5, 64, 80), dtype=bool)
+    for i in range(5):
+        masks[i, 10 * i:10 * i + 8, 5:15] = True
+
+    tracemalloc.start()
+    traces = scmf.extractTraces(1, masks, chunk_frames=16, crop=False)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < data[1].nbytes / 4
+    ref = np.stack([data[1][:, m].mean(axis=1) for m in masks], axis=1)
+    assert np.allclose(traces, ref)
+
+
+def test_load_synthetic_xzy_file(tmp_path):
+    data = gen_data(12, 20, 40, [0])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xzy.smh"), dxFr=40, dzFr=20, nFr=12, inputChMask=0b001,
+        scanMode=4, data=data
+    )
+    scmf = try_load_file(fPath)
+    assert np.array_equal(scmf.getData(0), data[0])
+
+
+@pytest.mark.parametrize("mode", [None, "mmap"])
+def test_get_synthetic_frames(tmp_path, mode):
+    data = gen_data(30, 16, 40, [0, 2])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=30, inputChMask=0b101,
+        nBufPerFr=4, dxRetrace=4, dxOffs=2, data=data
+    )
+    scmf = SMP()
+    scmf.loadSMH(fPath)
+    if mode is not None:
+        scmf.loadSMP(mode=mode)
+
+    # Slice semantics, frames are read from the file also if not loaded
+    for start, stop in [(0, 30), (3, 7), (-5, None), (28, 40), (7, 3)]:
+        assert np.array_equal(scmf.getFrames(2, start, stop), data[2][start:stop, :, 2:-4])
+        assert np.array_equal(scmf.getFrames(0, start, stop, crop=False), data[0][start:stop])
+    assert scmf.getFrames(1) is None
+
+
+def test_iter_synthetic_frames(tmp_path):
+    data = gen_data(30, 16, 40, [0, 1])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=30, inputChMask=0b011,
+        dxRetrace=4, dxOffs=2, data=data
+    )
+    scmf = SMP()
+    scmf.loadSMH(fPath)
+
+    blocks = list(scmf.iterFrames(1, chunk_frames=8))
+    assert [t0 for t0, _ in blocks] == [0, 8, 16, 24]
+    assert [len(b) for _, b in blocks] == [8, 8, 8, 6]
+    assert np.array_equal(np.concatenate([b for _, b in blocks]), data[1][..., 2:-4])
+
+    # Stopping early also stops reading ahead
+    it = scmf.iterFrames(0, chunk_frames=4, crop=False)
+    t0, block = next(it)
+    it.close()
+    assert t0 == 0 and np.array_equal(block, data[0][:4])
+    assert list(scmf.iterFrames(2)) == []
+
+
+def test_poll_synthetic_frames(tmp_path):
+    data = gen_data(12, 16, 40, [0, 1])
+    gen_scmf_files(
+        str(tmp_path / "rec.smh"), dxFr=40, dyFr=16, nFr=12, inputChMask=0b011,
+        dxRetrace=4, dxOffs=2, data=data
+    )
+    (tmp_path / "live.smh").write_bytes((tmp_path / "rec.smh").read_bytes())
+    buf = (tmp_path / "rec.smp").read_bytes()
+    nByteFr = 2 * 16 * 40 * 2
+    ref = data[1][..., 2:-4]
+
+    scmf = SMP()
+    scmf.loadSMH(str(tmp_path / "live.smh"))
+    assert scmf.pollFrames(1) is None
+
+    # Frames are appended (also incomplete ones), finally the post-header
+    sizes = [0, 2.5 * nByteFr, 2.5 * nByteFr, 7 * nByteFr, 12 * nByteFr, len(buf)]
+    expected = [(0, 0), (0, 2), (2, 0), (2, 5), (7, 5), (12, 0)]
+    for n, (t0, nNew) in zip(sizes, expected):
+        (tmp_path / "live.smp").write_bytes(buf[:int(n)])
+        res = scmf.pollFrames(1)
+        assert res[0] == t0 and np.array_equal(res[1], ref[t0:t0 + nNew])
+        assert scmf.isSMPFinal == (n == len(buf))
+
+    # Follow a finished recording and a stalled one
+    scmf = SMP()
+    scmf.loadSMH(str(tmp_path / "live.smh"))
+    blocks = list(scmf.followFrames(0, crop=False, interval_s=0.01))
+    assert len(blocks) == 1 and np.array_equal(blocks[0][1], data[0])
+    (tmp_path / "live.smp").write_bytes(buf[:3 * nByteFr])
+    scmf = SMP()
+    scmf.loadSMH(str(tmp_path / "live.smh"))
+    blocks = list(scmf.followFrames(0, crop=False, interval_s=0.01, timeout_s=0.05))
+    assert [t0 for t0, _ in blocks] == [0] and not scmf.isSMPFinal
+
+
+def test_read_synthetic_frames(tmp_path):
+    data = gen_data(30, 16, 40, [0, 1, 2])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=30, nBufPerFr=4, data=data
+    )
+    scmf = SMP()
+    scmf.loadSMH(fPath)
+
+    assert np.array_equal(scmf.getFrames(1, 5, 9, crop=False), data[1][5:9])
+    blocks = [b for _, b in scmf.iterFrames(2, chunk_frames=8, crop=False)]
+    assert np.array_equal(np.concatenate(blocks), data[2])
+
+
+def test_write_synthetic_subset(tmp_path):
+    data = gen_data(30, 16, 40, [0, 1, 2])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=30, nBufPerFr=4, data=data
+    )
+    scmf = try_load_file(fPath)
+
+    w = scm_write_subset(scmf, str(tmp_path / "cut.smh"), 5, 20, channels=[0, 2], chunk_byte=3000)
+    assert w.nFr == 15
+    cut = try_load_file(str(tmp_path / "cut.smh"))
+    assert cut.nFr == 15
+    assert cut.channels == [0, 2]
+    assert cut.get("Zoom") == scmf.get("Zoom")
+    for ch in [0, 2]:
+        assert np.array_equal(cut.getData(ch), data[ch][5:20])
+
+    with SMPWriter(str(tmp_path / "re.smh"), cut, channels=[2]) as w:
+        for _, block in cut.iterFrames(2, chunk_frames=4, crop=False):
+            w.writeFrames({2: block[::-1]})
+    assert np.array_equal(try_load_file(str(tmp_path / "re.smh")).getData(2)[:4], data[2][5:9][::-1])
+
+    smh = SMH()
+    smh.loadSMH(fPath)
+    with pytest.raises(AssertionError, match="SMP"):
+        SMPWriter(str(tmp_path / "hdr.smh"), smh)
+
+
+@pytest.mark.parametrize("nBufPerFr", [1, 3, 4])
+def test_write_synthetic_bidirectional(tmp_path, nBufPerFr):
+    # Pixel buffers of whole images (4), or buffers that span both images (1, 3)
+    data = gen_data(10, 24, 40, [0, 1])
+    fPath = gen_scmf_files(
+        str(tmp_path / "bi.smh"), dxFr=40, dyFr=24, nFr=10, inputChMask=0b011,
+        nBufPerFr=nBufPerFr, dxRetrace=4, dxOffs=2, nImgPerFr=2, data=data
+    )
+    scmf = try_load_file(fPath)
+    ref = {ch: scmf.getData(ch) for ch in [0, 1]}
+
+    w = scm_write_subset(scmf, str(tmp_path / "cut.smh"), 4, 16, chunk_byte=1000)
+    assert w.nFr == 12
+    cut = try_load_file(str(tmp_path / "cut.smh"))
+    assert cut.nFr == 12
+    for ch in [0, 1]:
+        assert np.array_equal(cut.getData(ch), ref[ch][4:16])
+    with pytest.raises(AssertionError, match="complete frame"):
+        scm_write_subset(scmf, str(tmp_path / "odd.smh"), 4, 15)
+
+    # Frames are written in blocks of an odd number of images
+    with SMPWriter(str(tmp_path / "re.smh"), cut, channels=[1]) as w:
+        for _, block in cut.iterFrames(1, chunk_frames=3, crop=False):
+            w.writeFrames({1: block})
+        assert w.nFr == 12
+    assert np.array_equal(try_load_file(str(tmp_path / "re.smh")).getData(1), ref[1][4:16])
+    w = SMPWriter(str(tmp_path / "inc.smh"), cut, channels=[1])
+    w.writeFrames({1: cut.getFrames(1, 0, 3, crop=False)})
+    with pytest.raises(AssertionError, match="Incomplete frame"):
+        w.close()
+
+
+def test_write_synthetic_optimized(tmp_path):
+    # The pixel data geometry is prepared also if assertions are disabled
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=10, dxRetrace=4, dxOffs=2
+    )
+    script = (
+        "import sys\n"
+        "from scanmsupport.scanm.scanm_smp import SMP\n"
+        "from scanmsupport.scanm.scanm_smp_writer import scm_write_subset\n"
+        "scmf = SMP()\n"
+        "scmf.loadSMH(sys.argv[1])\n"
+        "print(scm_write_subset(scmf, sys.argv[2], 2, 8).nFr)\n"
+    )
+    res = _run_optimized(script, fPath, str(tmp_path / "cut.smh"))
+    assert res.returncode == 0, res.stderr
+    assert res.stdout.split()[-1] == "6"
+    cut = try_load_file(str(tmp_path / "cut.smh"))
+    assert cut.nFr == 6
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_export_synthetic_h5(tmp_path, compression):
+    h5py = pytest.importorskip("h5py")
+    data = gen_data(30, 16, 40, [0, 1, 2])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=30, dxRetrace=4, dxOffs=2, data=data
+    )
+    scmf = SMP()
+    scmf.loadSMH(fPath)
+
+    export_data(scmf, str(tmp_path / "xy.h5"), channels=[0, 2], chunk_frames=8,
+                compression=compression, workers=2)
+    with h5py.File(str(tmp_path / "xy.h5"), "r") as f:
+        assert sorted(f.keys()) == ["wDataCh0", "wDataCh2"]
+        assert f["wDataCh0"].chunks == (34, 16, 8)
+        for ch in [0, 2]:
+            assert np.array_equal(f[f"wDataCh{ch}"][()], data[ch][:, :, 2:-4].T)
+
+
+def test_export_synthetic_optimized(tmp_path):
+    # The frame access is prepared also if assertions are disabled (`python -O`)
+    pytest.importorskip("h5py")
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=10, dxRetrace=4, dxOffs=2
+    )
+    script = (
+        "import sys\n"
+        "from scanmsupport.export import export_data\n"
+        "from scanmsupport.scanm.scanm_smp import SMP\n"
+        "scmf = SMP()\n"
+        "scmf.loadSMH(sys.argv[1])\n"
+        "print(export_data(scmf, sys.argv[2], channels=[0])['nBytes'])\n"
+    )
+    res = _run_optimized(script, fPath, str(tmp_path / "xy.h5"))
+    assert res.returncode == 0, res.stderr
+    assert res.stdout.split()[-1] == str(10 * 16 * 34 * 2)
+
+    scmf = SMP()
+    scmf.loadSMH(fPath)
+    with pytest.raises(ValueError, match="channel 3"):
+        export_data(scmf, str(tmp_path / "ch3.h5"), channels=[3])
+
+
+@pytest.mark.parametrize("mode", ["read", "mmap"])
+@pytest.mark.parametrize("order", ["tyx", "xyt"])
+@pytest.mark.parametrize("dtype", [None, np.float32])
+def test_synthetic_data_layout(tmp_path, mode, order, dtype):
+    data = gen_data(10, 16, 40, [0, 1])
+    fPath = gen_scmf_files(
+        str(tmp_path / "xy.smh"), dxFr=40, dyFr=16, nFr=10, inputChMask=0b011,
+        nBufPerFr=4, dxRetrace=4, dxOffs=2, data=data
+    )
+    scmf = try_load_file(fPath, mode=mode)
+
+    d = scmf.getData(1, crop=True, order=order, dtype=dtype, contiguous=True)
+    ref = data[1][:, :, 2:-4]
+    ref = ref.T if order == "xyt" else ref
+    assert d.flags.c_contiguous
+    assert d.dtype == (ref.dtype if dtype is None else dtype)
+    assert np.array_equal(d, ref)
+
+    # Frames gathered from the mapped pixel buffers are kept
+    d = scmf.getData(1)
+    assert np.shares_memory(scmf.getData(1), d)
+    assert np.shares_memory(scmf.getData(1, crop=True), d)
+    assert not d.flags.writeable if mode == "mmap" else d.flags.writeable
+    assert np.array_equal(d, data[1])
+
+
+@pytest.mark.parametrize("mode", ["read", "mmap"])
+@pytest.mark.parametrize("scanMode", [3, 5])
+def test_load_synthetic_volumes(tmp_path, mode, scanMode):
+    # XYZ: x is the fast axis, pixel data is scanned as (t, z, y, x)
+    # ZXY: z is the fast axis, pixel data is scanned as (t, y, x, z)
+    shape = (9, 6, 8, 20) if scanMode == 3 else (9, 8, 12, 20)
+    rng = np.random.default_rng(1)
+    data = {ch: rng.integers(0, 2 ** 16, shape, dtype=np.uint16) for ch in [0, 1]}
+    dx, dy, dz = (20, 8, 6) if scanMode == 3 else (12, 8, 20)
+    fPath = gen_scmf_files(
+        str(tmp_path / "vol.smh"), dxFr=dx, dyFr=dy, dzFr=dz, nFr=9, inputChMask=0b011,
+        scanMode=scanMode, nBufPerFr=4, dxRetrace=3, dxOffs=2, data=data
+    )
+    scmf = try_load_file(fPath, mode=mode)
+
+    for ch in [0, 1]:
+        ref = data[ch] if scanMode == 3 else data[ch].transpose(0, 3, 1, 2)
+        refCrop = ref[..., 2:-3] if scanMode == 3 else ref[:, 2:-3]
+        assert np.array_equal(scmf.getData(ch), ref)
+        assert np.array_equal(scmf.getData(ch, crop=True), refCrop)
+        assert np.array_equal(scmf.getData(ch, crop=True, order="xyt", contiguous=True), refCrop.T)
+        assert np.array_equal(scmf.getFrames(ch, 2, 5), refCrop[2:5])
+
+
+@pytest.mark.parametrize("mode", ["read", "mmap"])
+@pytest.mark.parametrize("nImgPerFr", [2, 3])
+def test_load_synthetic_bidirectional(tmp_path, mode, nImgPerFr):
+    data = gen_data(8, 12 * nImgPerFr, 40, [0, 1])
+    fPath = gen_scmf_files(
+        str(tmp_path / "bi.smh"), dxFr=40, dyFr=12 * nImgPerFr, nFr=8, inputChMask=0b011,
+        nBufPerFr=2 * nImgPerFr, dxRetrace=4, dxOffs=2, nImgPerFr=nImgPerFr, data=data
+    )
+    scmf = try_load_file(fPath, mode=mode)
+
+    # Every other image is scanned backwards
+    ref = {ch: data[ch].reshape((8 * nImgPerFr, 12, 40)).copy() for ch in [0, 1]}
+    for ch in [0, 1]:
+        ref[ch][1::2] = ref[ch][1::2, ::-1]
+    assert scmf.nFr == 8 * nImgPerFr
+    assert scmf.dyFrDec_pix == 12
+    for ch in [0, 1]:
+        assert np.array_equal(scmf.getData(ch), ref[ch])
+        assert np.array_equal(scmf.getFrames(ch, 3, 7, crop=False), ref[ch][3:7])
+
+    scm_write_subset(scmf, str(tmp_path / "cut.smh"), 2 * nImgPerFr, channels=[1])
+    cut = try_load_file(str(tmp_path / "cut.smh"), mode=mode)
+    assert np.array_equal(cut.getData(1), ref[1][2 * nImgPerFr:])
+
+
+@pytest.mark.parametrize("nBufPerFr", [4, 3, 5])
+@pytest.mark.parametrize("order", ["tyx", "xyt"])
+def test_synthetic_bidirectional_layout(tmp_path, nBufPerFr, order):
+    # Images of whole pixel buffers (4), or buffers that span images or lines (3, 5)
+    data = gen_data(40, 24, 40, [0, 1])
+    fPath = gen_scmf_files(
+        str(tmp_path / "bi.smh"), dxFr=40, dyFr=24, nFr=40, inputChMask=0b011,
+        nBufPerFr=nBufPerFr, dxRetrace=4, dxOffs=2, nImgPerFr=2, data=data
+    )
+    scmf = try_load_file(fPath, mode="mmap")
+
+    ref = data[1].reshape((80, 12, 40))[..., 2:-4].astype(np.float32)
+    ref[1::2] = ref[1::2, ::-1]
+    ref = ref.T if order == "xyt" else ref
+    tracemalloc.start()
+    d = scmf.getData(1, crop=True, order=order, dtype=np.float32)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert np.array_equal(d, ref)
+    if nBufPerFr == 4:
+        # Lines are gathered straight into the output
+        assert peak < d.nbytes + 2 ** 16
+
+
+@pytest.mark.parametrize("mode", ["read", "mmap"])
+@pytest.mark.parametrize("scanMode", [0, 3, 5])
+def test_load_synthetic_averaged_zstack(tmp_path, mode, scanMode):
+    # Frames (or volumes) in scan order, see `test_load_synthetic_volumes`
+    shape = {0: (16, 40), 3: (4, 8, 20), 5: (8, 12, 20)}[scanMode]
+    dx, dy, dz = {0: (40, 16, 0), 3: (20, 8, 4), 5: (12, 8, 20)}[scanMode]
+    rng = np.random.default_rng(2)
+    data = {ch: rng.integers(0, 2 ** 16, (6 * 5,) + shape, dtype=np.uint16) for ch in [0, 2]}
+    fPath = gen_scmf_files(
+        str(tmp_path / "zstack.smh"), dxFr=dx, dyFr=dy, dzFr=dz, nFr=6, nFrPerStep=5,
+        inputChMask=0b101, scanMode=scanMode, dxRetrace=4, dxOffs=2, data=data
+    )
+    scmf = try_load_file(fPath, mode=mode, zStackVar=True)
+
+    def toDec(a):
+        return a.transpose(0, 3, 1, 2) if scanMode == 5 else a
+
+    assert scmf.nFr == 6
+    for ch in [0, 2]:
+        frames = data[ch].reshape((6, 5) + shape).astype(np.float64)
+        av, var = frames.mean(axis=1), frames.var(axis=1)
+        assert np.allclose(scmf.getData(ch), toDec(av))
+        assert np.allclose(scmf.getData(ch, crop=True), toDec(av[..., 2:-4]))
+        assert np.allclose(scmf.getVariance(ch), toDec(var))
+        assert np.allclose(scmf.getVariance(ch, crop=True), toDec(var[..., 2:-4]))
+
+    scm_write_subset(scmf, str(tmp_path / "cut.smh"), 2, 5, channels=[2], chunk_byte=3000)
+    cut = try_load_file(str(tmp_path / "cut.smh"), mode=mode)
+    assert cut.nFr == 3 and cut.get("NFrPerStep") == 5
+    frames = data[2].reshape((6, 5) + shape).astype(np.float64)
+    assert np.allclose(cut.getData(2), toDec(frames[2:5].mean(axis=1)))
+
+
+class _SnakeDecoder(ScanDecoder):
+    # Resorting decoder, every other line is scanned backwards
+    def prepare(self, stimBuf, params):
+        self.frShape = (params[2], params[1])
+        return 0
+
+    def decode(self, block):
+        fr = block.reshape((-1,) + self.frShape).copy()
+        fr[:, 1::2] = fr[:, 1::2, ::-1]
+        return fr
+
+
+class _BinDecoder(ScanDecoder):
+    # Reconstructing decoder, 2x2 binning
+    def prepare(self, stimBuf, params):
+        self.frShape = (params[2] // 2, params[1] // 2)
+        return ScM_PixDataDecoded
+
+    def decode(self, block):
+        fr = block.reshape((-1, self.frShape[0], 2, self.frShape[1], 2))
+        return fr.mean(axis=(2, 4))
+
+
+@pytest.mark.parametrize("mode", ["read", "mmap"])
+def test_load_synthetic_decoded(tmp_path, mode):
+    data = gen_data(10, 16, 40, [0, 1])
+    for name in ["TestSnake", "TestBin"]:
+        gen_scmf_files(
+            str(tmp_path / f"{name}.smh"), dxFr=40, dyFr=16, nFr=10, inputChMask=0b011,
+            dxRetrace=4, dxOffs=2, data=data, scanPathFunc=name
+        )
+    scmf = SMP()
+    scmf.loadSMH(str(tmp_path / "TestSnake.smh"))
+    assert scmf.loadSMP(mode=mode) == ERR_NotImplemented
+
+    scm_register_decoder("TestSnake", _SnakeDecoder)
+    scm_register_decoder("TestBin")(_BinDecoder)
+    try:
+        scmf = try_load_file(str(tmp_path / "TestSnake.smh"), mode=mode)
+        binned = try_load_file(str(tmp_path / "TestBin.smh"), mode=mode)
+        # Resorting decoder is replaced by a pixel permutation, hence, can be mapped
+        assert scmf._StimBuf.pixIdx is not None and binned._StimBuf.pixIdx is None
+        assert scmf._isMapped == (mode == "mmap") and not binned._isMapped
+        for ch in [0, 1]:
+            ref = data[ch].copy()
+            ref[:, 1::2] = ref[:, 1::2, ::-1]
+            assert np.array_equal(scmf.getData(ch), ref)
+            assert np.array_equal(scmf.getData(ch, crop=True), ref)
+            assert np.array_equal(scmf.getData(ch, dtype=np.float32, order="xyt"), ref.T)
+            assert np.array_equal(scmf.getFrames(ch, 2, 5), ref[2:5])
+
+            ref = data[ch].reshape((10, 8, 2, 20, 2)).mean(axis=(2, 4))
+            assert binned.getData(ch).dtype == np.float64
+            assert np.allclose(binned.getData(ch), ref)
+            assert np.allclose(binned.getFrames(ch, 4, 10), ref[4:])
+    finally:
+        scm_unregister_decoder("TestSnake")
+        scm_unregister_decoder("TestBin")
+
+
+@pytest.mark.parametrize("mode", ["read", "mmap"])
+def test_write_synthetic_decoded(tmp_path, mode):
+    data = gen_data(10, 16, 40, [0, 1])
+    fPath = gen_scmf_files(
+        str(tmp_path / "TestBin.smh"), dxFr=40, dyFr=16, nFr=10, inputChMask=0b011,
+        nBufPerFr=4, dxRetrace=4, dxOffs=2, data=data, scanPathFunc="TestBin"
+    )
+    scm_register_decoder("TestBin", _BinDecoder)
+    try:
+        binned = try_load_file(fPath, mode=mode)
+        # Pixel buffers are copied as recorded and decoded again when loaded
+        w = scm_write_subset(binned, str(tmp_path / "cut.smh"), 2, 8, channels=[1])
+        assert w.nFr == 6
+        cut = try_load_file(str(tmp_path / "cut.smh"), mode=mode)
+        ref = data[1].reshape((10, 8, 2, 20, 2)).mean(axis=(2, 4))
+        assert np.allclose(cut.getData(1), ref[2:8])
+
+        with pytest.raises(AssertionError, match="Decoded"):
+            with SMPWriter(str(tmp_path / "re.smh"), binned, channels=[1]) as w:
+                w.writeFrames({1: binned.getFrames(1, 0, 2)})
+    finally:
+        scm_unregister_decoder("TestBin")
+
+
+def test_stim_buf_cache(tmp_path):
+    class _CountingDecoder(_SnakeDecoder):
+        nPrepared = 0
+
+        def prepare(self, stimBuf, params):
+            _CountingDecoder.nPrepared += 1
+            return super().prepare(stimBuf, params)
+
+    data = gen_data(4, 16, 40, [0])
+    for i, dyFr in enumerate([16, 16, 8]):
+        gen_scmf_files(
+            str(tmp_path / f"rec{i}.smh"), dxFr=40, dyFr=dyFr, nFr=4, inputChMask=0b001,
+            data=None if i == 2 else data, seed=i, scanPathFunc="TestCached"
+        )
+    scm_register_decoder("TestCached", _CountingDecoder)
+    SCMIO_stimBufCache.clear()
+    try:
+        recs = [try_load_file(str(tmp_path / f"rec{i}.smh")) for i in range(3)]
+        # Same scan path, different GUID: decoder prepared only once
+        assert _CountingDecoder.nPrepared == 2
+        assert recs[0]._StimBuf.decoder is recs[1]._StimBuf.decoder
+        assert np.array_equal(recs[0].getData(0), recs[1].getData(0))
+        assert recs[2].getData(0).shape == (4, 8, 40)
+        assert SCMIO_stimBufCache.stats["nHits"] >= 1
+    finally:
+        scm_unregister_decoder("TestCached")
+        SCMIO_stimBufCache.clear()
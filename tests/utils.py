@@ -1,16 +1,16 @@
 from scanmsupport.scanm.scanm_smp import SMP
 
 
-def load_file(filepath):
+def load_file(filepath, **kwargs):
     scmf = SMP()
     err_load_smh = scmf.loadSMH(filepath, verbose=False)
-    err_load_smp = scmf.loadSMP(filepath)
+    err_load_smp = scmf.loadSMP(filepath, **kwargs)
     return scmf, err_load_smh, err_load_smp
 
 
-def try_load_file(filepath):
+def try_load_file(filepath, **kwargs):
     try:
-        scmf, err_load_smh, err_load_smp = load_file(filepath)
+        scmf, err_load_smh, err_load_smp = load_file(filepath, **kwargs)
         assert isinstance(scmf, SMP), "File not loaded"
         assert err_load_smh == 0, "SMH not loaded"
         assert err_load_smp == 0, "SMP not loaded"